@@ -0,0 +1,971 @@
+import json
+import hashlib
+import os
+import sqlite3
+import re
+import queue
+import threading
+import weakref
+from collections import OrderedDict
+from concurrent.futures import Future
+import perf
+from parsers import MOF_CHUNK_ROWS, iter_messy_excel_batches
+from lazy import lazy_module
+
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+
+# ==========================================
+# 後端邏輯區 (資料庫、規則、匯入)
+# ==========================================
+
+DB_NAME = "accounting.db"
+RULES_FILE = "rules.json"  # 舊版規則檔，第一次啟動時會搬進資料庫
+CATEGORY_OPTIONS = [
+    "飲食", "日常用品", "交通", "水電瓦斯", "居家", 
+    "服飾", "娛樂", "美容美髮", "交際應酬", "學習深造", 
+    "車", "醫療保健", "3C家電", "其他"
+]
+LEDGER_CACHE_MAX_ENTRIES = 2    # 同時快取幾個資料庫的帳本
+LEDGER_DELTA_MAX_RATIO = 0.2    # 變動超過這個比例就直接整表重讀
+CHANGELOG_KEEP = 10000          # expense_changes 最多保留幾筆
+WRITE_BATCH_MAX = 64            # 寫入執行緒一個交易最多併幾個操作
+READER_POOL_MAX = 8             # 每個資料庫保留幾條閒置的讀取連線
+# 月彙總表要維護的維度：維度名稱 -> (expenses 欄位, 只統計 (欄位, 值) 相符的列；None 代表全部)
+UNCATEGORIZED = ("category", "其他")
+ROLLUP_DIMS = {"category": ("category", None), "store": ("store", None),
+               "uncat_store": ("store", UNCATEGORIZED), "uncat_item": ("item", UNCATEGORIZED)}
+STORE_KEYWORD_MIN_CHARS = 3     # 不同店名合併成同一個建議關鍵字時，共用開頭至少要這麼長
+
+# --- 連線管理：讀取連線從共用池借給執行緒，寫入全部排進單一寫入執行緒 ---
+_local = threading.local()
+_WRITERS = {}
+_WRITERS_LOCK = threading.Lock()
+_READER_POOL = {}       # 資料庫 -> 閒置的讀取連線
+_INITIALIZED = set()    # 這個行程已經建表/升級過的資料庫
+
+def _connect(db_name):
+    # isolation_level=None：交易由寫入執行緒自己用 BEGIN/COMMIT 控制
+    conn = sqlite3.connect(db_name, isolation_level=None, check_same_thread=False, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    # temp_store 維持預設 (檔案)：MEMORY 模式下 savepoint 的子日誌全放記憶體，
+    # 寫入執行緒每個操作都包 savepoint，大量 UPDATE 會越跑越慢
+    conn.execute("PRAGMA cache_size=-20000")
+    return conn
+
+class _Borrowed:
+    # 執行緒借走的連線；執行緒結束時 threading.local 釋放這個物件，連線就回到共用池
+    # (Streamlit 每次 rerun 換一個執行緒，連線不會跟著執行緒一起丟掉)
+    def __init__(self):
+        self.conns = {}
+        weakref.finalize(self, _return_connections, self.conns)
+
+def _return_connections(conns):
+    with _WRITERS_LOCK:
+        for db_name, conn in conns.items():
+            pool = _READER_POOL.setdefault(db_name, [])
+            if len(pool) < READER_POOL_MAX and not conn.in_transaction: pool.append(conn)
+            else: conn.close()
+
+def get_connection():
+    """目前執行緒的讀取連線：同一執行緒一直用同一條，優先拿共用池裡閒置的"""
+    borrowed = getattr(_local, 'borrowed', None)
+    if borrowed is None: borrowed = _local.borrowed = _Borrowed()
+    conn = borrowed.conns.get(DB_NAME)
+    if conn is None:
+        with _WRITERS_LOCK:
+            pool = _READER_POOL.get(DB_NAME)
+            conn = pool.pop() if pool else None
+        borrowed.conns[DB_NAME] = conn = conn or _connect(DB_NAME)
+    return conn
+
+class _Writer:
+    """單一寫入執行緒：把排隊中的寫入併成一個交易，commit 後才回報結果"""
+    def __init__(self, db_name):
+        self.db_name = db_name
+        self.queue = queue.Queue()
+        threading.Thread(target=self._run, name=f"sqlite-writer:{db_name}", daemon=True).start()
+
+    def _run(self):
+        conn = _connect(self.db_name)
+        while True:
+            batch = [self.queue.get()]
+            while len(batch) < WRITE_BATCH_MAX:
+                try: batch.append(self.queue.get_nowait())
+                except queue.Empty: break
+            self._run_batch(conn, batch)
+
+    def _run_batch(self, conn, batch):
+        results = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            for fn, args, future in batch:
+                # 每個操作包一層 savepoint，單一操作失敗不會拖累同批其他人
+                conn.execute("SAVEPOINT op")
+                try:
+                    results.append((future, fn(conn, *args), None))
+                    conn.execute("RELEASE op")
+                except Exception as e:
+                    conn.execute("ROLLBACK TO op")
+                    conn.execute("RELEASE op")
+                    results.append((future, None, e))
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction: conn.execute("ROLLBACK")
+            for _, _, future in batch: future.set_exception(e)
+            return
+        for future, result, error in results:
+            if error is None: future.set_result(result)
+            else: future.set_exception(error)
+
+def submit_write(fn, *args):
+    """把 fn(conn, *args) 排進寫入佇列，回傳 Future"""
+    with _WRITERS_LOCK:
+        writer = _WRITERS.get(DB_NAME)
+        if writer is None: writer = _WRITERS[DB_NAME] = _Writer(DB_NAME)
+    future = Future()
+    writer.queue.put((fn, args, future))
+    return future
+
+def run_write(fn, *args):
+    """排進寫入佇列並等它 commit 完成，失敗時把例外丟回呼叫端"""
+    return submit_write(fn, *args).result()
+
+def _init_db(conn):
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS expenses 
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, store TEXT, item TEXT, price INTEGER)''')
+    c.execute("PRAGMA table_xinfo(expenses)")
+    columns = [info[1] for info in c.fetchall()]
+    if "fixed_category" not in columns:
+        c.execute("ALTER TABLE expenses ADD COLUMN fixed_category TEXT")
+    # 分類結果直接存在表裡，並記錄是用哪一版規則算出來的
+    for col in ["category", "display_item", "rules_version"]:
+        if col not in columns:
+            c.execute(f"ALTER TABLE expenses ADD COLUMN {col} TEXT")
+    # 匯入資料的內容指紋，重複匯入同一份檔案時靠唯一索引略過 (手動輸入/拆帳為 NULL，不受限制)
+    if "fingerprint" not in columns:
+        c.execute("ALTER TABLE expenses ADD COLUMN fingerprint TEXT")
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_expenses_fingerprint ON expenses(fingerprint)")
+    # 月份做成 generated column，彙總查詢直接走索引
+    if "month" not in columns:
+        c.execute("ALTER TABLE expenses ADD COLUMN month TEXT GENERATED ALWAYS AS (substr(date, 1, 7)) VIRTUAL")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_category ON expenses(category)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses(date)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_store ON expenses(store)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_expenses_month_category ON expenses(month, category, price)")
+    c.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT)")
+    c.execute('''CREATE TABLE IF NOT EXISTS rules
+                 (keyword TEXT PRIMARY KEY, category TEXT NOT NULL, item TEXT, position INTEGER NOT NULL)''')
+    c.execute("CREATE INDEX IF NOT EXISTS idx_rules_position ON rules(position)")
+    _migrate_rules_json(conn)
+    _normalize_dates(conn)
+    # 變動紀錄：讓 load_from_db 知道哪些 id 被新增/修改/刪除，只重讀差異
+    c.execute("CREATE TABLE IF NOT EXISTS expense_changes (seq INTEGER PRIMARY KEY AUTOINCREMENT, expense_id INTEGER)")
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_insert AFTER INSERT ON expenses
+                 BEGIN INSERT INTO expense_changes (expense_id) VALUES (NEW.id); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_update AFTER UPDATE ON expenses
+                 BEGIN INSERT INTO expense_changes (expense_id) VALUES (NEW.id); END''')
+    c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_delete AFTER DELETE ON expenses
+                 BEGIN INSERT INTO expense_changes (expense_id) VALUES (OLD.id); END''')
+    _init_rollup(conn)
+    # 明細搜尋用的全文索引 (trigram，中文不用斷詞)；SQLite 太舊不支援時就退回 LIKE 搜尋
+    if not _has_table(conn, "expenses_fts"):
+        try:
+            c.execute("""CREATE VIRTUAL TABLE expenses_fts USING fts5(store, display_item,
+                         content='expenses', content_rowid='id', tokenize='trigram')""")
+            c.execute("INSERT INTO expenses_fts (expenses_fts) VALUES ('rebuild')")
+        except sqlite3.OperationalError: pass
+    if _has_table(conn, "expenses_fts"):
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_insert AFTER INSERT ON expenses BEGIN
+                     INSERT INTO expenses_fts (rowid, store, display_item) VALUES (NEW.id, NEW.store, NEW.display_item);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_delete AFTER DELETE ON expenses BEGIN
+                     INSERT INTO expenses_fts (expenses_fts, rowid, store, display_item)
+                     VALUES ('delete', OLD.id, OLD.store, OLD.display_item);
+                     END''')
+        c.execute('''CREATE TRIGGER IF NOT EXISTS trg_expenses_fts_update AFTER UPDATE OF store, display_item ON expenses BEGIN
+                     INSERT INTO expenses_fts (expenses_fts, rowid, store, display_item)
+                     VALUES ('delete', OLD.id, OLD.store, OLD.display_item);
+                     INSERT INTO expenses_fts (rowid, store, display_item) VALUES (NEW.id, NEW.store, NEW.display_item);
+                     END''')
+
+# --- 月彙總表：(月份, 維度, 值) 的金額與筆數，由 trigger 逐筆增減，儀表板只讀這張小表 ---
+def _rollup_cond(row, where):
+    return f"{row}.{where[0]} = '{where[1]}'" if where else "1"
+
+def _rollup_add_sql(row, sign, dim, col, where):
+    # 月份/值為 NULL 時存成空字串 (WITHOUT ROWID 的主鍵不能是 NULL)
+    # 用 SELECT ... WHERE 而不是 VALUES，有條件的維度不相符時就不會寫入
+    return f"""INSERT INTO monthly_rollup (month, dim, key, total, count)
+               SELECT COALESCE({row}.month, ''), '{dim}', COALESCE({row}.{col}, ''), {sign}COALESCE({row}.price, 0), {sign}1
+               WHERE {_rollup_cond(row, where)}
+               ON CONFLICT (month, dim, key) DO UPDATE SET total = total + excluded.total, count = count + excluded.count;"""
+
+def _rollup_remove_sql(dim, col, where):
+    return _rollup_add_sql("OLD", "-", dim, col, where) + f"""
+               DELETE FROM monthly_rollup WHERE month = COALESCE(OLD.month, '') AND dim = '{dim}'
+                                            AND key = COALESCE(OLD.{col}, '') AND count = 0;"""
+
+def _rollup_select_sql(dim, col, where):
+    return f"""SELECT COALESCE(month, '') AS month, '{dim}' AS dim, COALESCE({col}, '') AS key,
+                      COALESCE(SUM(price), 0) AS total, COUNT(*) AS count
+               FROM expenses WHERE {_rollup_cond("expenses", where)} GROUP BY 1, 3"""
+
+def _rebuild_rollup(conn):
+    conn.execute("DELETE FROM monthly_rollup")
+    for dim, (col, where) in ROLLUP_DIMS.items():
+        conn.execute(f"INSERT INTO monthly_rollup (month, dim, key, total, count) {_rollup_select_sql(dim, col, where)}")
+
+def _init_rollup(conn):
+    conn.execute('''CREATE TABLE IF NOT EXISTS monthly_rollup
+                    (month TEXT NOT NULL, dim TEXT NOT NULL, key TEXT NOT NULL, total INTEGER NOT NULL,
+                     count INTEGER NOT NULL, PRIMARY KEY (month, dim, key)) WITHOUT ROWID''')
+    # 維度設定沒變就不用動；變了 (或第一次建立) 就重建 trigger 並從明細重算一次
+    schema = json.dumps(ROLLUP_DIMS, sort_keys=True)
+    if _get_meta(conn, 'rollup_dims') == schema: return
+    for (name,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND name LIKE 'trg_rollup_%'").fetchall():
+        conn.execute(f"DROP TRIGGER {name}")
+    for dim, (col, where) in ROLLUP_DIMS.items():
+        conn.execute(f"""CREATE TRIGGER trg_rollup_{dim}_insert AFTER INSERT ON expenses BEGIN
+                         {_rollup_add_sql("NEW", "", dim, col, where)} END""")
+        conn.execute(f"""CREATE TRIGGER trg_rollup_{dim}_delete AFTER DELETE ON expenses BEGIN
+                         {_rollup_remove_sql(dim, col, where)} END""")
+        # 規則變動重新分類時，只有分類 (或條件欄位) 真的變了的列才會動到彙總
+        watched = list(dict.fromkeys(["date", "price", col] + ([where[0]] if where else [])))
+        changed = " OR ".join(f"OLD.{c} IS NOT NEW.{c}" for c in watched)
+        conn.execute(f"""CREATE TRIGGER trg_rollup_{dim}_update AFTER UPDATE OF {", ".join(watched)} ON expenses
+                         WHEN {changed} BEGIN
+                         {_rollup_remove_sql(dim, col, where)}
+                         {_rollup_add_sql("NEW", "", dim, col, where)} END""")
+    _rebuild_rollup(conn)
+    _set_meta(conn, 'rollup_dims', schema)
+
+def verify_rollup(repair=False):
+    """從明細重算月彙總並與維護中的彙總表比對，回傳不一致的列 (month/dim/key/expected_*/actual_*)；
+    repair=True 時有差異就整張重建"""
+    conn = get_connection()
+    # 兩個查詢包在同一個讀取交易裡，看到的是同一個時間點的資料
+    conn.execute("BEGIN")
+    try:
+        expected = pd.read_sql(" UNION ALL ".join(_rollup_select_sql(d, c, w) for d, (c, w) in ROLLUP_DIMS.items()), conn)
+        actual = pd.read_sql("SELECT month, dim, key, total, count FROM monthly_rollup", conn)
+    finally:
+        conn.execute("COMMIT")
+    merged = expected.merge(actual, on=['month', 'dim', 'key'], how='outer', suffixes=('_expected', '_actual'))
+    merged[['total_expected', 'count_expected', 'total_actual', 'count_actual']] = \
+        merged[['total_expected', 'count_expected', 'total_actual', 'count_actual']].fillna(0)
+    diff = merged[(merged['total_expected'] != merged['total_actual']) | (merged['count_expected'] != merged['count_actual'])]
+    if repair and not diff.empty: run_write(_rebuild_rollup)
+    return diff.reset_index(drop=True)
+
+def _has_table(conn, name):
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (name,)).fetchone() is not None
+
+def init_db():
+    """建表/升級；同一個行程對同一個資料庫只排進寫入佇列一次，之後每次 rerun 直接返回，
+    不會卡在別人的大量寫入後面"""
+    with _WRITERS_LOCK:
+        if DB_NAME in _INITIALIZED and os.path.exists(DB_NAME): return
+    run_write(_init_db)
+    with _WRITERS_LOCK: _INITIALIZED.add(DB_NAME)
+
+def _insert_expenses(conn, data):
+    # data 欄位即資料表欄位名稱；缺值一律轉成 None 再交給 executemany
+    # 指紋重複的列直接略過 (INSERT OR IGNORE)，回傳實際新增的筆數
+    data = data.astype(object).where(data.notna(), None)
+    cols = ", ".join(data.columns)
+    marks = ", ".join("?" * len(data.columns))
+    last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM expenses").fetchone()[0]
+    cur = conn.executemany(f"INSERT OR IGNORE INTO expenses ({cols}) VALUES ({marks})",
+                           data.itertuples(index=False, name=None))
+    if 'rules_version' in data.columns and len(data): _fix_stale_rows(conn, data['rules_version'].iloc[0], last_id)
+    return cur.rowcount
+
+def _fix_stale_rows(conn, version, last_id):
+    # 分類是在交易外先算好的；排隊期間規則被改過的話，用交易內讀到的規則重算這次新增的列
+    rules = _read_rules(conn)
+    if rules_version(rules) == version: return 0
+    return _reclassify(conn, "id > ? AND rules_version = ?", (last_id, version), rules)
+
+def _classified_rows(df, rules):
+    # 寫入前先分類，讀取時不用再算
+    cols = ['date', 'store', 'item', 'price', 'fixed_category'] + (['fingerprint'] if 'fingerprint' in df.columns else [])
+    data = df[cols].copy()
+    # 日期統一存成 YYYY-MM-DD，month 欄位才會正確
+    data['date'] = pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d')
+    data[['category', 'display_item']] = classify_db_rows(data, rules).to_numpy()
+    data['rules_version'] = rules_version(rules)
+    return data
+
+def _import_rows(df):
+    # 匯入用的 DataFrame (中文欄位) 轉成資料表欄位
+    # 確保有 fixed_category 欄位，如果沒有就補上 None
+    if 'fixed_category' not in df.columns:
+        df['fixed_category'] = None
+    data = df[['日期', '商店名稱', '品項', '金額', 'fixed_category']].copy()
+    data.columns = ['date', 'store', 'item', 'price', 'fixed_category']
+    data['date'] = pd.to_datetime(data['date']).dt.strftime('%Y-%m-%d')
+    return data
+
+def compute_fingerprints(data, source, seen=None):
+    """日期|商店|品項|金額|來源 的雜湊；同一批裡完全相同的列再加上第幾次出現，
+    所以同一天同一家店買兩次一樣的東西不會被當成重複。
+    seen 用來跨批次延續出現次數 (串流匯入時用)，會被就地更新"""
+    key = (data['date'].astype(str) + '|' + data['store'].astype(str) + '|' + data['item'].astype(str)
+           + '|' + data['price'].astype(str) + '|' + source)
+    nth = key.groupby(key).cumcount()
+    if seen:
+        nth = nth + key.map(seen).fillna(0).astype('int64')
+    if seen is not None:
+        for k, n in key.value_counts().items(): seen[k] = seen.get(k, 0) + n
+    return [hashlib.sha1(f"{k}|{i}".encode('utf-8')).hexdigest()[:24] for k, i in zip(key, nth)]
+
+def count_duplicates(fingerprints):
+    """已經在資料庫裡的指紋數量 (走唯一索引查詢，不會讀整本帳)"""
+    conn = get_connection()
+    found = 0
+    for i in range(0, len(fingerprints), 500):
+        chunk = fingerprints[i:i + 500]
+        found += conn.execute(f"SELECT COUNT(*) FROM expenses WHERE fingerprint IN ({','.join('?' * len(chunk))})",
+                              chunk).fetchone()[0]
+    return found
+
+@perf.timed(rows=sum)
+def preview_import(df, source):
+    """匯入前預覽：回傳 (新資料筆數, 重複筆數)"""
+    fingerprints = compute_fingerprints(_import_rows(df.copy()), source)
+    dup = count_duplicates(fingerprints)
+    return len(fingerprints) - dup, dup
+
+@perf.timed(rows=int)
+def save_to_db(df, source=None, seen=None):
+    """寫入資料庫並回傳新增筆數；有給 source (mof/daily/standard) 時會計算指紋，已匯入過的列自動略過"""
+    data = _import_rows(df)
+    if source: data['fingerprint'] = compute_fingerprints(data, source, seen)
+    return run_write(_insert_expenses, _classified_rows(data, load_custom_rules()))
+
+def _insert_batches(conn, datas):
+    return [_insert_expenses(conn, data) for data in datas]
+
+@perf.timed(rows=sum)
+def save_batches_to_db(batches):
+    """多個檔案一起匯入 [(DataFrame, source)]：指紋各檔分開算 (跟逐檔 save_to_db 一樣)，
+    分類一次算完，全部在同一個交易寫入；回傳各檔新增筆數"""
+    datas = []
+    for df, source in batches:
+        data = _import_rows(df.copy())
+        if source: data['fingerprint'] = compute_fingerprints(data, source)
+        datas.append(data)
+    if not datas: return []
+    rules = load_custom_rules()
+    sizes = [len(d) for d in datas]
+    classified = _classified_rows(pd.concat(datas, ignore_index=True), rules)
+    bounds = np.cumsum([0] + sizes)
+    return run_write(_insert_batches, [classified.iloc[a:b] for a, b in zip(bounds[:-1], bounds[1:])])
+
+def _update_transaction(conn, row_id, new_item_name, new_price, new_category):
+    conn.execute("UPDATE expenses SET item = ?, price = ?, fixed_category = ? WHERE id = ?", 
+                 (new_item_name, new_price, new_category, row_id))
+    _reclassify(conn, "id = ?", (row_id,), _read_rules(conn))
+
+def update_transaction(row_id, new_item_name, new_price, new_category):
+    run_write(_update_transaction, row_id, new_item_name, new_price, new_category)
+
+def _delete_transaction(conn, row_id):
+    conn.execute("DELETE FROM expenses WHERE id = ?", (row_id,))
+
+def delete_transaction(row_id):
+    run_write(_delete_transaction, row_id)
+
+def split_transaction(original_id, new_items_df):
+    try:
+        bulk_apply_changes(deletes=[original_id], inserts=new_items_df)
+        return True
+    except: return False
+
+# --- 批次異動：一次交易完成所有刪除/修改/新增 ---
+def diff_detail_edits(original_df, edited_df):
+    """用 id 對齊比對明細編輯結果，回傳 (要刪除的 id, 要更新的列)"""
+    orig = original_df.set_index('id')[['分類結果', '顯示品項', '金額']]
+    joined = edited_df.set_index('id').join(orig, rsuffix='_原始')
+    deleted = joined['刪除'] == True
+    changed = ~deleted & (joined['分類結果'].ne(joined['分類結果_原始'])
+                          | joined['品項'].ne(joined['顯示品項'])
+                          | joined['金額'].ne(joined['金額_原始']))
+    updates = joined.loc[changed, ['品項', '金額', '分類結果']].reset_index()
+    updates.columns = ['id', 'item', 'price', 'fixed_category']
+    return joined.index[deleted].tolist(), updates
+
+def _bulk_apply_changes(conn, deletes, updates, inserts):
+    conn.executemany("DELETE FROM expenses WHERE id = ?", [(i,) for i in deletes])
+    if updates is not None and not updates.empty:
+        # 規則在交易內讀，排隊期間規則被改過也不會用到舊的
+        rules = _read_rules(conn)
+        ids = updates['id'].tolist()
+        conn.executemany("UPDATE expenses SET item = ?, price = ?, fixed_category = ? WHERE id = ?",
+                         zip(updates['item'].tolist(), updates['price'].tolist(), updates['fixed_category'].tolist(), ids))
+        for i in range(0, len(ids), 500):
+            chunk = ids[i:i + 500]
+            _reclassify(conn, f"id IN ({','.join('?' * len(chunk))})", chunk, rules)
+    if inserts is not None and not inserts.empty:
+        _insert_expenses(conn, inserts)
+
+@perf.timed(rows=lambda counts: sum(counts.values()))
+def bulk_apply_changes(deletes=(), updates=None, inserts=None):
+    """在同一個交易內刪除、更新 (id/item/price/fixed_category)、新增 (date/store/item/price/fixed_category)，
+    回傳各自的筆數"""
+    deletes = [int(i) for i in deletes]
+    if inserts is not None and not inserts.empty: inserts = _classified_rows(inserts, load_custom_rules())
+    counts = {"deleted": len(deletes),
+              "updated": 0 if updates is None else len(updates),
+              "inserted": 0 if inserts is None else len(inserts)}
+    if any(counts.values()): run_write(_bulk_apply_changes, deletes, updates, inserts)
+    return counts
+
+# --- 帳本快取：以 (generation, 最新變動序號) 當版本，沒變就直接回傳記憶體中的資料 ---
+_LEDGER_CACHE = OrderedDict()
+LEDGER_COLUMNS = "id, date, store, item, price, fixed_category, category, display_item"
+
+LEDGER_TEXT_COLUMNS = ['商店名稱', '品項', 'fixed_category', '分類結果', '顯示品項', '月份']
+LEDGER_READ_CHUNK = 100000      # 整表重讀時每批讀幾筆，讀完一批就轉成精簡格式
+
+def _compact_price(price):
+    # 金額都是整數且在 int32 範圍內就用 int32，否則保留原本的型別
+    price = pd.to_numeric(price)
+    if len(price) and price.notna().all() and (price % 1 == 0).all() and price.abs().max() < 2**31:
+        return price.astype('int32')
+    return price
+
+def _ledger_frame(df):
+    """資料表欄位轉成帳本格式：文字欄位用 category、金額 int32、日期 datetime64"""
+    df = df.rename(columns={'date': '日期', 'store': '商店名稱', 'item': '品項', 'price': '金額',
+                            'category': '分類結果', 'display_item': '顯示品項'})
+    df['日期'] = pd.to_datetime(df['日期'])
+    # 月份只對不重複的月份做格式化
+    months = df['日期'].dt.to_period('M').astype('category')
+    df['月份'] = months.cat.rename_categories(months.cat.categories.strftime('%Y-%m'))
+    df['金額'] = _compact_price(df['金額'])
+    for col in LEDGER_TEXT_COLUMNS[:-1]: df[col] = df[col].astype('category')
+    return df
+
+def _concat_ledgers(parts):
+    # 直接 concat 分類不同的 category 欄位會退回 object，先把分類對齊
+    parts = [p for p in parts if len(p)] or parts[:1]
+    if len(parts) == 1: df = parts[0]
+    else:
+        parts = [p.copy(deep=False) for p in parts]
+        for col in LEDGER_TEXT_COLUMNS:
+            # 全空的欄位分類型別是 object，其他是 str，不能直接 union_categoricals
+            merged = pd.Index(pd.unique(np.concatenate([p[col].cat.categories.to_numpy(dtype=object) for p in parts])))
+            for p in parts: p[col] = p[col].cat.set_categories(merged)
+        df = pd.concat(parts, ignore_index=True)
+    # 有小數金額的列被刪掉後可以再縮回 int32
+    if df['金額'].dtype != 'int32': df = df.assign(金額=_compact_price(df['金額']))
+    return df
+
+def _read_ledger(conn):
+    chunks = pd.read_sql(f"SELECT {LEDGER_COLUMNS} FROM expenses ORDER BY id", conn, chunksize=LEDGER_READ_CHUNK)
+    parts = [_ledger_frame(chunk) for chunk in chunks]
+    return _concat_ledgers(parts) if parts else _ledger_frame(pd.read_sql(f"SELECT {LEDGER_COLUMNS} FROM expenses", conn))
+
+def data_version(conn):
+    """目前帳本的版本；clear_db 會換 generation，其餘寫入會讓變動序號往上加"""
+    generation = _get_meta(conn, 'data_generation')
+    seq = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM expense_changes").fetchone()[0]
+    return generation, seq
+
+def ledger_version():
+    """給畫面快取用的帳本版本：任何寫入 (含規則變動造成的重新分類) 都會讓它改變；帶上檔名，換資料庫不會撞到"""
+    return (DB_NAME, *data_version(get_connection()))
+
+def _load_ledger_delta(conn, cached, seq):
+    # 只重讀變動過的 id；變動紀錄被清掉或變動太多時回傳 None 改成整表重讀
+    first = conn.execute("SELECT MIN(seq) FROM expense_changes WHERE seq > ?", (cached['seq'],)).fetchone()[0]
+    if first is None or first != cached['seq'] + 1: return None
+    changed = [r[0] for r in conn.execute("SELECT DISTINCT expense_id FROM expense_changes WHERE seq > ? AND seq <= ?",
+                                          (cached['seq'], seq))]
+    base = cached['df']
+    if len(changed) > max(len(base), 1) * LEDGER_DELTA_MAX_RATIO: return None
+    parts = [base[~base['id'].isin(changed)]]
+    for i in range(0, len(changed), 500):
+        chunk = changed[i:i + 500]
+        fresh = pd.read_sql(f"SELECT {LEDGER_COLUMNS} FROM expenses WHERE id IN ({','.join('?' * len(chunk))})",
+                            conn, params=chunk)
+        if not fresh.empty: parts.append(_ledger_frame(fresh))
+    return _concat_ledgers(parts).sort_values('id', ignore_index=True)
+
+def _prune_changelog(conn, seq):
+    conn.execute("DELETE FROM expense_changes WHERE seq <= ?", (seq - CHANGELOG_KEEP,))
+
+def invalidate_ledger_cache(db_name=None):
+    """丟掉快取，下次 load_from_db 會整表重讀；不給 db_name 就全部清掉"""
+    if db_name is None: _LEDGER_CACHE.clear()
+    else: _LEDGER_CACHE.pop(db_name, None)
+
+@perf.timed()
+def load_from_db():
+    """整本帳 (精簡格式)。同一個資料庫在整個行程只存一份，回傳的是共用資料的淺複本：
+    加欄位或改值只會影響自己拿到的這份，不要就地修改底層陣列"""
+    conn = get_connection()
+    try:
+        generation, seq = data_version(conn)
+        cached = _LEDGER_CACHE.get(DB_NAME)
+        df = None
+        if cached is not None and cached['generation'] == generation:
+            df = cached['df'] if cached['seq'] == seq else _load_ledger_delta(conn, cached, seq)
+        if df is None:
+            df = _read_ledger(conn)
+        _LEDGER_CACHE[DB_NAME] = {'generation': generation, 'seq': seq, 'df': df}
+        _LEDGER_CACHE.move_to_end(DB_NAME)
+        while len(_LEDGER_CACHE) > LEDGER_CACHE_MAX_ENTRIES: _LEDGER_CACHE.popitem(last=False)
+        # 變動紀錄太長就在背景清掉舊的，不用等它寫完
+        oldest = conn.execute("SELECT MIN(seq) FROM expense_changes").fetchone()[0]
+        if oldest is not None and seq - oldest >= CHANGELOG_KEEP: submit_write(_prune_changelog, seq)
+        df = df.copy(deep=False)
+    except: df = pd.DataFrame()
+    return df
+
+def _clear_db(conn):
+    conn.execute("DELETE FROM expenses")
+    # 全部清空就不用留逐筆變動紀錄，換一個 generation 讓快取整個失效
+    conn.execute("DELETE FROM expense_changes")
+    _set_meta(conn, 'data_generation', str(int(_get_meta(conn, 'data_generation') or 0) + 1))
+
+def clear_db():
+    run_write(_clear_db)
+    invalidate_ledger_cache(DB_NAME)
+
+# --- 彙總查詢：直接在 SQLite 算，不用先把整本帳讀進來 ---
+def _query(sql, params=()):
+    return pd.read_sql(sql, get_connection(), params=params)
+
+def _month_filter(month):
+    return ("WHERE month = ?", (month,)) if month else ("", ())
+
+@perf.timed(rows=len)
+def list_months():
+    """資料庫中出現過的月份，新到舊"""
+    return _query("""SELECT DISTINCT month FROM monthly_rollup WHERE dim = 'category' AND month != ''
+                     ORDER BY month DESC""")['month'].tolist()
+
+def _rollup_filter(dim, month):
+    return (f"WHERE dim = '{dim}' AND month = ?", (month,)) if month else (f"WHERE dim = '{dim}'", ())
+
+@perf.timed()
+def monthly_totals():
+    return _query("""SELECT NULLIF(month, '') AS 月份, SUM(total) AS 金額 FROM monthly_rollup
+                     WHERE dim = 'category' GROUP BY month ORDER BY month""")
+
+@perf.timed(rows=lambda r: r[1])
+def month_summary(month=None):
+    """(總消費, 總筆數, 未分類筆數)；month 為 None 代表所有時間"""
+    where, params = _rollup_filter('category', month)
+    df = _query(f"""SELECT COALESCE(SUM(total), 0) AS total, COALESCE(SUM(count), 0) AS cnt,
+                           COALESCE(SUM(CASE WHEN key = '其他' THEN count END), 0) AS unknown
+                    FROM monthly_rollup {where}""", params)
+    return int(df['total'][0]), int(df['cnt'][0]), int(df['unknown'][0])
+
+@perf.timed()
+def category_totals(month=None):
+    where, params = _rollup_filter('category', month)
+    return _query(f"""SELECT NULLIF(key, '') AS 分類結果, SUM(total) AS 金額 FROM monthly_rollup {where}
+                      GROUP BY key ORDER BY 金額""", params)
+
+@perf.timed()
+def store_totals(month=None, limit=None):
+    """各商店的消費金額與筆數，金額大到小"""
+    where, params = _rollup_filter('store', month)
+    sql = f"""SELECT NULLIF(key, '') AS 商店名稱, SUM(total) AS 金額, SUM(count) AS 筆數 FROM monthly_rollup {where}
+              GROUP BY key ORDER BY 金額 DESC"""
+    if limit: sql += f" LIMIT {int(limit)}"
+    return _query(sql, params)
+
+_STORE_TOKEN_SPLIT = re.compile(r"[\s()（）]+")
+_STORE_KEY_TRIM = re.compile(r"[\s\d第號#＃\-－_/／(（]+$")
+_STORE_LEGAL = re.compile(r"股份有限公司|有限公司|企業社|商行|(?<!分)公司")
+_STORE_BRANCH = re.compile(r"\S{0,6}(?:分公司|分店|門市|營業所|店)")
+
+def _store_core(name):
+    # 只在明確的邊界切：空白分隔的第一段、公司登記名稱 (股份有限公司…) 之前、尾端的編號；
+    # 每一步切完不到兩個字就不切
+    core = name.strip()
+    for cut in (lambda c: _STORE_TOKEN_SPLIT.split(c, maxsplit=1)[0],
+                lambda c: c[:m.start()] if (m := _STORE_LEGAL.search(c)) else c,
+                lambda c: _STORE_KEY_TRIM.sub("", c)):
+        shorter = cut(core)
+        if len(shorter) >= 2: core = shorter
+    return core
+
+def store_keywords(names):
+    """每個店名的建議關鍵字，讓同一連鎖的不同分店合併成一條規則。
+    先把店名切成主體 (_store_core)；主體相同的直接合併，排序後相鄰的主體如果共用至少
+    STORE_KEYWORD_MIN_CHARS 個字的開頭、而且每個剩下的部分都是分店名 (…店/門市/分公司)，
+    整組用同一個共用開頭。關鍵字都是店名的子字串，存成規則一定比對得到"""
+    cores = {name: _store_core(name) for name in set(names)}
+    ordered = sorted(set(cores.values()))
+    keys, i = {}, 0
+    while i < len(ordered):
+        j, prefix = i + 1, ordered[i]
+        while j < len(ordered):
+            shared = _STORE_KEY_TRIM.sub("", os.path.commonprefix([prefix, ordered[j]]))
+            if len(shared) < STORE_KEYWORD_MIN_CHARS: break
+            if not all(c == shared or _STORE_BRANCH.fullmatch(c[len(shared):]) for c in ordered[i:j + 1]): break
+            prefix, j = shared, j + 1
+        for core in ordered[i:j]: keys[core] = prefix
+        i = j
+    return [keys[cores[name]] for name in names]
+
+@perf.timed()
+def uncategorized_suggestions(month=None):
+    """未分類商店/品項的規則建議 (關鍵字/類型/參考金額/筆數/店名數)，依影響金額大到小；
+    讀的是 trigger 維護的未分類彙總，不用掃明細"""
+    where, params = _rollup_filter('uncat_store', month)
+    stores = _query(f"""SELECT key AS 店名, SUM(total) AS 參考金額, SUM(count) AS 筆數 FROM monthly_rollup
+                        {where} AND TRIM(key) NOT IN ('-', '') GROUP BY key""", params)
+    stores['關鍵字'] = store_keywords(stores['店名'].tolist())
+    stores = stores.groupby('關鍵字', as_index=False).agg(參考金額=('參考金額', 'sum'), 筆數=('筆數', 'sum'),
+                                                        店名數=('店名', 'size'))
+    stores['類型'] = "商店"
+
+    where, params = _rollup_filter('uncat_item', month)
+    items = _query(f"""SELECT key AS 關鍵字, SUM(total) AS 參考金額, SUM(count) AS 筆數 FROM monthly_rollup
+                       {where} AND key NOT IN ({','.join('?' * len(DEFAULT_ITEMS))}) GROUP BY key""",
+                   params + tuple(DEFAULT_ITEMS))
+    items = items[~items['關鍵字'].isin(set(stores['關鍵字']))].assign(類型="品項")
+
+    out = pd.concat([stores, items], ignore_index=True)
+    out = out.sort_values(['參考金額', '筆數'], ascending=False, ignore_index=True).astype({'店名數': 'Int64'})
+    return out[['關鍵字', '類型', '參考金額', '筆數', '店名數']]
+
+@perf.timed()
+def category_details(category, month=None):
+    """點選分類後的明細，日期新到舊"""
+    where, params = _month_filter(month)
+    where = f"{where} AND category = ?" if where else "WHERE category = ?"
+    df = _query(f"""SELECT date AS 日期, store AS 商店名稱, display_item AS 顯示品項, price AS 金額
+                    FROM expenses {where} ORDER BY date DESC""", params + (category,))
+    df['日期'] = pd.to_datetime(df['日期'])
+    return df
+
+# --- 明細搜尋：全文索引 + 日期範圍，一次只取一頁 ---
+DETAIL_PAGE_SIZE = 200
+
+def _like_pattern(term):
+    return "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+@perf.timed()
+def search_transactions(term="", start=None, end=None, month=None, page=0, page_size=DETAIL_PAGE_SIZE, count=True):
+    """依關鍵字 (商店/品項，純數字時也比對金額)、日期範圍 (含頭尾)、月份搜尋明細，
+    日期新到舊排序；回傳 (第 page 頁的資料, 總筆數)。count=False 時不算總筆數 (回傳 None)，
+    翻頁時總筆數沒變，不用再掃一次"""
+    conn = get_connection()
+    conds, params = [], []
+    if start: conds.append("date >= ?"); params.append(str(start))
+    if end: conds.append("date <= ?"); params.append(str(end))
+    if month: conds.append("month = ?"); params.append(month)
+    term = (term or "").strip()
+    if term:
+        # trigram 至少要 3 個字才查得到，太短就用 LIKE 掃日期範圍內的資料
+        if len(term) >= 3 and _has_table(conn, "expenses_fts"):
+            text_cond = "id IN (SELECT rowid FROM expenses_fts WHERE expenses_fts MATCH ?)"
+            text_params = ['"' + term.replace('"', '""') + '"']
+        else:
+            text_cond = "(store LIKE ? ESCAPE '\\' OR display_item LIKE ? ESCAPE '\\')"
+            text_params = [_like_pattern(term)] * 2
+        if term.isdigit():
+            text_cond = f"({text_cond} OR CAST(price AS TEXT) LIKE ?)"
+            text_params.append(_like_pattern(term))
+        conds.append(text_cond); params += text_params
+    where = ("WHERE " + " AND ".join(conds)) if conds else ""
+    total = conn.execute(f"SELECT COUNT(*) FROM expenses {where}", params).fetchone()[0] if count else None
+    df = pd.read_sql(f"""SELECT id, date AS 日期, store AS 商店名稱, display_item AS 顯示品項, price AS 金額,
+                                category AS 分類結果
+                         FROM expenses {where} ORDER BY date DESC, id DESC LIMIT ? OFFSET ?""",
+                     conn, params=params + [page_size, page * page_size])
+    return df, total
+
+@perf.timed()
+def recent_transactions(limit=30):
+    """最新的 limit 筆交易 (id/日期/商店名稱/金額)，日期新到舊；走日期索引，不用讀整本帳"""
+    return _query("""SELECT id, date AS 日期, store AS 商店名稱, price AS 金額 FROM expenses
+                     ORDER BY date DESC, id DESC LIMIT ?""", (int(limit),))
+
+# --- 規則存放在 rules 資料表：position 決定優先順序，rules_revision 當快取版本 ---
+_RULES_CACHE = {}
+
+def _load_rules_json(path):
+    # 舊版 rules.json：值可能是分類字串或 {"category", "item"}
+    with open(path, 'r', encoding='utf-8') as f:
+        raw_data = json.load(f)
+    normalized = {}
+    for k, v in raw_data.items():
+        if isinstance(v, str): normalized[k] = {"category": v, "item": None}
+        else: normalized[k] = {"category": v.get('category'), "item": v.get('item')}
+    return normalized
+
+def _migrate_rules_json(conn):
+    # 只搬一次 (看 app_meta 的旗標)，之後就算規則全刪光也不會再從檔案匯回來
+    if _get_meta(conn, 'rules_migrated'): return
+    if os.path.exists(RULES_FILE):
+        rules = _load_rules_json(RULES_FILE)
+        _write_rules(conn, [(k, v['category'], v['item']) for k, v in rules.items()], replace=True)
+    _set_meta(conn, 'rules_migrated', '1')
+
+def _normalize_dates(conn):
+    # 舊版用 to_sql 直接存原始日期字串 (2025/1/5 之類)，month 欄位跟日期範圍搜尋都會錯；只轉一次。
+    # 在彙總表建立之前跑，已經有 trigger 的資料庫也會跟著更新彙總與全文索引
+    if _get_meta(conn, 'dates_normalized'): return
+    df = pd.read_sql("SELECT id, date FROM expenses "
+                     "WHERE date NOT GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'", conn)
+    if not df.empty:
+        iso = pd.to_datetime(df['date'], errors='coerce', format='mixed').dt.strftime('%Y-%m-%d')
+        ok = iso.notna()
+        conn.executemany("UPDATE expenses SET date = ? WHERE id = ?", zip(iso[ok], df['id'][ok].tolist()))
+    _set_meta(conn, 'dates_normalized', '1')
+
+def _read_rules(conn):
+    rows = conn.execute("SELECT keyword, category, item FROM rules ORDER BY position, rowid").fetchall()
+    return {k: {"category": c, "item": i} for k, c, i in rows}
+
+def _clean_item(item):
+    return None if item is None or (isinstance(item, float) and pd.isna(item)) or item == '' else item
+
+def _write_rules(conn, items, replace=False):
+    # replace=True 時整組取代 (順序照 items)；否則 upsert，新的關鍵字排在最後、舊的保留原本順序
+    if replace: conn.execute("DELETE FROM rules")
+    start = conn.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM rules").fetchone()[0]
+    conn.executemany("""INSERT INTO rules (keyword, category, item, position) VALUES (?, ?, ?, ?)
+                        ON CONFLICT(keyword) DO UPDATE SET category = excluded.category, item = excluded.item""",
+                     [(k, c, _clean_item(i), start + n) for n, (k, c, i) in enumerate(items)])
+    _set_meta(conn, 'rules_revision', str(int(_get_meta(conn, 'rules_revision') or 0) + 1))
+
+def _save_rules(conn, items, replace):
+    # 規則與受影響的分類結果在同一個交易裡更新
+    _write_rules(conn, items, replace)
+    return _sync_classifications(conn)
+
+@perf.timed(rows=len)
+def load_custom_rules():
+    """依優先順序排列的規則；rules_revision 沒變就直接用記憶體中的結果"""
+    conn = get_connection()
+    revision = _get_meta(conn, 'rules_revision')
+    cached = _RULES_CACHE.get(DB_NAME)
+    if cached is None or cached[0] != revision:
+        cached = _RULES_CACHE[DB_NAME] = (revision, _read_rules(conn))
+    return dict(cached[1])
+
+def upsert_rules(items):
+    """一次新增/更新多條規則 [(關鍵字, 分類, 預設品項)]，單一交易完成，回傳重新分類的筆數"""
+    items = list(items)
+    if not items: return 0
+    return run_write(_save_rules, items, False)
+
+def save_custom_rule(keyword, category, item_name=None):
+    return upsert_rules([(keyword, category, item_name)])
+
+def save_all_rules(new_rules_dict):
+    items = [(k, v['category'], v.get('item')) for k, v in new_rules_dict.items()]
+    return run_write(_save_rules, items, True)
+
+def apply_rules_to_row(row, custom_rules):
+    final_cat = "其他"
+    final_item = str(row.get('品項', ''))
+    s = str(row.get('商店名稱', ''))
+    
+    if pd.notna(row.get('fixed_category')) and row.get('fixed_category'):
+        final_cat = row['fixed_category']
+        return pd.Series([final_cat, final_item])
+
+    rule_matched = False
+    for k, v in custom_rules.items():
+        if k in s or k in final_item:
+            final_cat = v['category']
+            if v.get('item') and final_item in ["一般消費", "-", "nan", ""]:
+                final_item = v['item']
+            rule_matched = True
+            break
+    
+    if not rule_matched:
+        if "7-ELEVEN" in s or "全家" in s: final_cat = "飲食"
+        elif "全聯" in s or "家樂福" in s: final_cat = "日常用品"
+        elif "中油" in s: final_cat = "車"
+        elif "Uber" in s or "高鐵" in s or "台鐵" in s: final_cat = "交通"
+        elif "星巴克" in s or "麥當勞" in s or "壽司郎" in s: final_cat = "飲食"
+        elif "Uniqlo" in s or "NET" in s: final_cat = "服飾"
+        elif "屈臣氏" in s or "康是美" in s: final_cat = "醫療保健"
+        elif "好市多" in s or "Costco" in s: final_cat = "日常用品"
+    
+    return pd.Series([final_cat, final_item])
+
+# --- 編譯式規則引擎：整欄一次分類，語意與 apply_rules_to_row 相同 ---
+# 內建商店關鍵字 (順序即優先序，對應 apply_rules_to_row 的 elif 鏈)
+BUILTIN_STORE_RULES = [
+    ("7-ELEVEN", "飲食"), ("全家", "飲食"),
+    ("全聯", "日常用品"), ("家樂福", "日常用品"),
+    ("中油", "車"),
+    ("Uber", "交通"), ("高鐵", "交通"), ("台鐵", "交通"),
+    ("星巴克", "飲食"), ("麥當勞", "飲食"), ("壽司郎", "飲食"),
+    ("Uniqlo", "服飾"), ("NET", "服飾"),
+    ("屈臣氏", "醫療保健"), ("康是美", "醫療保健"),
+    ("好市多", "日常用品"), ("Costco", "日常用品"),
+]
+DEFAULT_ITEMS = ["一般消費", "-", "nan", ""]
+
+def _compile_matcher(keywords):
+    # 所有關鍵字合成一個 regex；lookahead 讓每個位置都能命中，
+    # 同一位置 alternation 依序嘗試，所以取到的是規則順序最前面的那條
+    if not keywords: return None
+    pattern = re.compile("(?=(" + "|".join(re.escape(k) for k in keywords) + "))")
+    return pattern, {k: i for i, k in enumerate(keywords)}
+
+def _first_match(texts, matcher, miss):
+    # 每個字串命中的最小規則編號，沒命中回傳 miss
+    out = np.full(len(texts), miss, dtype=np.int64)
+    if matcher is None: return out
+    pattern, index = matcher
+    for i, t in enumerate(texts):
+        found = pattern.findall(t)
+        if found: out[i] = min(index[k] for k in set(found))
+    return out
+
+def _factorize_text(values):
+    # 等同逐列 str(value)，但只對不重複的值做字串轉換
+    codes, uniques = pd.factorize(values)
+    texts = [str(u) for u in uniques]
+    missing = codes < 0
+    if missing.any():
+        na_codes, na_uniques = pd.factorize(values[missing].map(str))
+        codes = codes.copy()
+        codes[missing] = na_codes + len(texts)
+        texts += list(na_uniques)
+    return codes, texts
+
+def compile_rules(custom_rules):
+    """把自訂規則與內建商店關鍵字編譯成比對器，規則沒變就可重複使用"""
+    keywords = list(custom_rules.keys())
+    return {
+        "rules": [custom_rules[k] for k in keywords],
+        "custom": _compile_matcher(keywords),
+        "builtin": _compile_matcher([k for k, _ in BUILTIN_STORE_RULES]),
+    }
+
+@perf.timed()
+def apply_rules_to_df(df, compiled):
+    """整欄向量化分類，回傳與 apply_rules_to_row 相同的 [分類結果, 顯示品項]"""
+    n = len(df)
+    stores = df['商店名稱'] if '商店名稱' in df.columns else pd.Series([''] * n, index=df.index)
+    items = df['品項'] if '品項' in df.columns else pd.Series([''] * n, index=df.index)
+    rules = compiled["rules"]
+    miss = len(rules)
+
+    store_codes, store_texts = _factorize_text(stores)
+    item_codes, item_texts = _factorize_text(items)
+
+    # 自訂規則：商店或品項任一命中即可，取規則順序最前面的
+    hit = np.minimum(_first_match(store_texts, compiled["custom"], miss)[store_codes],
+                     _first_match(item_texts, compiled["custom"], miss)[item_codes])
+    builtin_miss = len(BUILTIN_STORE_RULES)
+    builtin_hit = _first_match(store_texts, compiled["builtin"], builtin_miss)[store_codes]
+
+    rule_cats = np.array([r['category'] for r in rules] + [None], dtype=object)
+    builtin_cats = np.array([c for _, c in BUILTIN_STORE_RULES] + ["其他"], dtype=object)
+    matched = hit < miss
+    category = np.where(matched, rule_cats[hit], builtin_cats[builtin_hit])
+
+    # fixed_category 優先於所有規則
+    if 'fixed_category' in df.columns:
+        fixed = df['fixed_category'].to_numpy(dtype=object)
+        has_fixed = pd.notna(fixed)
+        has_fixed[has_fixed] = [bool(x) for x in fixed[has_fixed]]
+        category = np.where(has_fixed, fixed, category)
+        matched &= ~has_fixed
+
+    # 命中的規則有預設品項，且原品項是「一般消費」之類的預設值時才替換
+    item_arr = np.array(item_texts, dtype=object)
+    is_default = np.isin(item_arr, DEFAULT_ITEMS)[item_codes]
+    rule_items = np.array([r.get('item') for r in rules] + [None], dtype=object)
+    has_item = np.array([bool(x) for x in rule_items], dtype=bool)[hit]
+    display = np.where(matched & has_item & is_default, rule_items[hit], item_arr[item_codes])
+
+    return pd.DataFrame({'分類結果': category, '顯示品項': display}, index=df.index)
+
+# --- 分類結果持久化：規則改動時只重算受影響的列 ---
+def rules_version(rules):
+    # 規則順序會影響「第一條命中」，所以連順序一起雜湊
+    raw = json.dumps(list(rules.items()), ensure_ascii=False)
+    return hashlib.sha1(raw.encode('utf-8')).hexdigest()[:16]
+
+def classify_db_rows(data, rules):
+    """對資料庫欄位 (store/item/fixed_category) 的資料做分類"""
+    view = data.rename(columns={'store': '商店名稱', 'item': '品項'})
+    return apply_rules_to_df(view, compile_rules(rules))
+
+def changed_rule_keywords(old_rules, new_rules):
+    """新增、刪除、內容修改，或相對順序改變的關鍵字"""
+    changed = {k for k in old_rules if k not in new_rules}
+    changed |= {k for k in new_rules if k not in old_rules or new_rules[k] != old_rules[k]}
+    old_order = [k for k in old_rules if k in new_rules]
+    new_order = [k for k in new_rules if k in old_rules]
+    changed |= {a for a, b in zip(old_order, new_order) if a != b}
+    return changed
+
+def _get_meta(conn, key):
+    row = conn.execute("SELECT value FROM app_meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES (?, ?)", (key, value))
+
+def _reclassify(conn, where, params, rules):
+    # 重算符合條件的列，回傳更新筆數
+    df = pd.read_sql(f"SELECT id, store, item, fixed_category FROM expenses WHERE {where}", conn, params=params)
+    if df.empty: return 0
+    result = classify_db_rows(df, rules)
+    version = rules_version(rules)
+    conn.executemany("UPDATE expenses SET category = ?, display_item = ?, rules_version = ? WHERE id = ?",
+                     zip(result['分類結果'], result['顯示品項'], [version] * len(df), df['id'].tolist()))
+    return len(df)
+
+def _sync_classifications(conn):
+    rules = _read_rules(conn)
+    version = rules_version(rules)
+    updated = 0
+    if _get_meta(conn, 'rules_version') != version:
+        snapshot = _get_meta(conn, 'rules_snapshot')
+        if snapshot is None:
+            # 沒有快照 (新資料庫或舊版升級)：寫入時已經用這一版規則分類過的列不用重算
+            updated += _reclassify(conn, "rules_version IS NOT ?", (version,), rules)
+        else:
+            # 只挑出文字含有變動關鍵字的列；有固定分類的列不受規則影響
+            changed = list(changed_rule_keywords(dict(json.loads(snapshot)), rules))
+            for i in range(0, len(changed), 200):
+                chunk = changed[i:i + 200]
+                cond = " OR ".join(["instr(store, ?) > 0 OR instr(item, ?) > 0"] * len(chunk))
+                params = [k for k in chunk for _ in (0, 1)]
+                updated += _reclassify(conn, f"(fixed_category IS NULL OR fixed_category = '') AND "
+                                             f"(store IS NULL OR item IS NULL OR {cond})", params, rules)
+        _set_meta(conn, 'rules_version', version)
+        _set_meta(conn, 'rules_snapshot', json.dumps(list(rules.items()), ensure_ascii=False))
+    # 舊資料或外部寫入、還沒分類過的列
+    updated += _reclassify(conn, "category IS NULL", (), rules)
+    return updated
+
+@perf.timed(rows=int)
+def sync_classifications():
+    """讓資料庫內的分類結果跟上目前的規則；沒有變動時只做兩個唯讀查詢，不進寫入佇列"""
+    rules = load_custom_rules()
+    conn = get_connection()
+    if (_get_meta(conn, 'rules_version') == rules_version(rules)
+            and conn.execute("SELECT 1 FROM expenses WHERE category IS NULL LIMIT 1").fetchone() is None):
+        return 0
+    return run_write(_sync_classifications)
+
+@perf.timed(rows=int)
+def import_messy_excel_stream(source, chunksize=MOF_CHUNK_ROWS):
+    """大型財政部匯出檔：邊讀邊解析，每一批直接寫進資料庫，回傳匯入筆數"""
+    total, seen = 0, {}
+    for batch in iter_messy_excel_batches(source, chunksize):
+        total += save_to_db(batch, source='mof', seen=seen)
+    return total
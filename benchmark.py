@@ -0,0 +1,182 @@
+"""效能量測：不需要 Streamlit，直接執行 python benchmark.py
+
+每個後端熱點在 10k / 100k / 1M 筆資料下各量一次，輸出耗時、每秒處理筆數與記憶體峰值。
+--save-baseline 存下這次的結果，--compare 跟存下的結果比對，變慢或變胖超過容許值就以非零狀態結束。
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import backend
+import synthetic
+from parsers import parse_daily_accounting, parse_messy_excel, parse_messy_excel_rowwise
+
+DEFAULT_SIZES = [10000, 100000, 1000000]
+ROWWISE_CAP = 20000      # 逐列版本太慢，只量這麼多筆再換算
+RULE_COUNT = 200         # 量測用的自訂規則數量
+SEARCH_TERMS = ["全家便利", "早餐", "星巴克 信義"]
+QUICK_SECONDS = 0.1      # 比這個快的唯讀操作多跑幾次取最快，減少雜訊
+QUICK_REPEAT = 5
+COMPARE_MIN_SECONDS = 0.005  # 比對基準線時，太短的耗時/太小的記憶體不列入 (量測誤差比差異還大)
+COMPARE_MIN_MB = 1.0
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - start
+
+def timed_best(fn, *args):
+    """唯讀操作用：很快的話重複幾次取最快的一次"""
+    result, best = timed(fn, *args)
+    if best < QUICK_SECONDS:
+        for _ in range(QUICK_REPEAT - 1): best = min(best, timed(fn, *args)[1])
+    return result, best
+
+def peak_memory(fn, *args):
+    """另外跑一次量 Python 配置的記憶體峰值 (MB)，不跟計時混在一起以免 tracemalloc 拖慢計時"""
+    tracemalloc.start()
+    try:
+        fn(*args)
+        return tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+
+def use_db(path):
+    backend.DB_NAME = path
+    backend.init_db()
+
+def _record(results, name, n, seconds, rows=None, mem=None, note=""):
+    rows = n if rows is None else rows
+    results[f"{name}@{n}"] = {"seconds": seconds, "rows_per_sec": rows / seconds if seconds > 0 else None,
+                              "peak_mb": mem}
+    rate = f"{rows / seconds:>12,.0f} rows/s" if seconds > 0 else " " * 19
+    peak = f"{mem:8.1f} MB" if mem is not None else " " * 11
+    print(f"{name:<28} n={n:>8}  {seconds:9.3f}s  {rate}  peak={peak}  {note}")
+
+# --- 各熱點 ---
+def bench_save_to_db(results, n, workdir):
+    df = synthetic.make_expenses(n)
+    use_db(os.path.join(workdir, f"ledger_{n}.db"))
+    backend.save_all_rules(synthetic.make_rules(RULE_COUNT))
+    inserted, t = timed(backend.save_to_db, df.copy(), 'standard')
+    # 記憶體另外寫進一個空的資料庫，不然指紋重複全部被略過，量到的不是真的寫入
+    main_db = backend.DB_NAME
+    use_db(os.path.join(workdir, f"scratch_{n}.db"))
+    backend.save_all_rules(synthetic.make_rules(RULE_COUNT))
+    mem = peak_memory(backend.save_to_db, df.copy(), 'standard')
+    use_db(main_db)
+    _record(results, "save_to_db", n, t, inserted, mem)
+
+def bench_load_from_db(results, n):
+    backend.invalidate_ledger_cache()
+    df, t_cold = timed(backend.load_from_db)
+    backend.invalidate_ledger_cache()
+    mem = peak_memory(backend.load_from_db)
+    _record(results, "load_from_db (cold)", n, t_cold, len(df), mem)
+    df, t_warm = timed_best(backend.load_from_db)
+    _record(results, "load_from_db (warm)", n, t_warm, len(df), peak_memory(backend.load_from_db))
+
+def bench_classification(results, n):
+    rules = synthetic.make_rules(RULE_COUNT)
+    df = synthetic.make_expenses(n)
+    sample = df.head(ROWWISE_CAP)
+    old, t_row = timed(lambda: sample.apply(lambda r: backend.apply_rules_to_row(r, rules), axis=1))
+    t_row *= n / len(sample)
+    _record(results, "apply_rules_to_row", n, t_row,
+            note=f"(量 {len(sample)} 筆後換算)" if len(sample) < n else "")
+    compiled = backend.compile_rules(rules)
+    old.columns = ['分類結果', '顯示品項']
+    pd.testing.assert_frame_equal(old, backend.apply_rules_to_df(sample, compiled), check_dtype=False)
+    _, t_df = timed_best(backend.apply_rules_to_df, df, compiled)
+    _record(results, "apply_rules_to_df", n, t_df, mem=peak_memory(backend.apply_rules_to_df, df, compiled),
+            note=f"speedup={t_row / t_df:.1f}x  (輸出一致)")
+
+def bench_parse_messy_excel(results, n):
+    # 每張發票大約 2.1 列，n 是原始列數
+    df_raw = synthetic.make_mof_export(max(1, int(n / 2.1)))
+    sample = df_raw.head(ROWWISE_CAP)
+    old, t_old = timed(parse_messy_excel_rowwise, sample)
+    pd.testing.assert_frame_equal(old, parse_messy_excel(sample))
+    t_old *= len(df_raw) / len(sample)
+    _record(results, "parse_messy_excel_rowwise", n, t_old, len(df_raw),
+            note=f"(量 {len(sample)} 列後換算)" if len(sample) < len(df_raw) else "")
+    _, t_new = timed_best(parse_messy_excel, df_raw)
+    _record(results, "parse_messy_excel", n, t_new, len(df_raw), peak_memory(parse_messy_excel, df_raw),
+            note=f"speedup={t_old / t_new:.1f}x  (輸出一致)")
+
+def bench_parse_daily_accounting(results, n):
+    df = synthetic.make_daily_accounting(n)
+    _, t = timed_best(lambda: parse_daily_accounting(df.copy()))
+    _record(results, "parse_daily_accounting", n, t, mem=peak_memory(parse_daily_accounting, df.copy()))
+
+def bench_aggregations(results, n):
+    month = backend.list_months()[0]
+    cases = [
+        ("list_months", backend.list_months, ()),
+        ("monthly_totals", backend.monthly_totals, ()),
+        ("month_summary", backend.month_summary, (month,)),
+        ("category_totals", backend.category_totals, (month,)),
+        ("category_totals (all)", backend.category_totals, ()),
+    ]
+    for name, fn, args in cases:
+        _, t = timed_best(fn, *args)
+        _record(results, name, n, t, mem=peak_memory(fn, *args))
+    for term in SEARCH_TERMS:
+        _, t = timed_best(backend.search_transactions, term)
+        _record(results, f"search '{term}'", n, t, mem=peak_memory(backend.search_transactions, term))
+
+def run(sizes, workdir):
+    results = {}
+    for n in sizes:
+        print(f"--- {n:,} 筆 ---")
+        bench_save_to_db(results, n, workdir)
+        bench_load_from_db(results, n)
+        bench_classification(results, n)
+        bench_parse_messy_excel(results, n)
+        bench_parse_daily_accounting(results, n)
+        bench_aggregations(results, n)
+    return results
+
+# --- 基準線比對 ---
+def compare(results, baseline, tolerance):
+    """回傳超出容許值的項目；只比兩邊都有的項目"""
+    regressions = []
+    for key, base in baseline.items():
+        cur = results.get(key)
+        if cur is None: continue
+        for metric, floor in (("seconds", COMPARE_MIN_SECONDS), ("peak_mb", COMPARE_MIN_MB)):
+            old, new = base.get(metric), cur.get(metric)
+            if old is None or new is None or max(old, new) < floor: continue
+            old = max(old, floor)
+            ratio = new / old
+            if ratio > 1 + tolerance: regressions.append((key, metric, old, new, ratio))
+    return regressions
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--save-baseline", metavar="PATH", help="把結果存成 JSON 基準線")
+    parser.add_argument("--compare", metavar="PATH", help="跟 JSON 基準線比對")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="容許變慢/變胖的比例 (預設 0.25 = 25%%)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        results = run(args.sizes, workdir)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"基準線已存到 {args.save_baseline}")
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for key, metric, old, new, ratio in regressions:
+            print(f"退步: {key} {metric} {old:.3f} -> {new:.3f} ({ratio:.2f}x)")
+        if regressions: sys.exit(1)
+        print(f"與基準線比對通過 (容許 {args.tolerance:.0%})")
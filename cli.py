@@ -0,0 +1,120 @@
+"""命令列批次模式：不開 Streamlit 也能匯入、分類、出報表
+
+    python cli.py ingest exports/              # 平行匯入資料夾內所有 CSV/XLSX (已匯入過的列自動略過)
+    python cli.py ingest dumps/ --stream-mb 16 # 超過 16 MB 的財政部匯出檔分批串流匯入，記憶體用量固定
+    python cli.py classify                     # 依目前規則補算/重算分類
+    python cli.py report --by month            # 每月總額 (CSV 輸出到 stdout)
+    python cli.py report --by category --month 2025-01 --format json -o 2025-01.json
+    python cli.py report --by uncategorized    # 未分類商店/品項的規則建議，影響金額大到小
+    python cli.py verify --repair              # 從明細重算月彙總表，跟維護中的比對 (有差異就重建)
+"""
+import argparse
+import os
+import sys
+
+import backend
+from parsers import IMPORT_EXTENSIONS, STREAM_MIN_BYTES, parse_files, should_stream
+
+def iter_import_files(directory, recursive=False):
+    """資料夾內可匯入的檔案，依路徑排序 (匯入順序固定，指紋才會一致)"""
+    if recursive:
+        paths = [os.path.join(root, f) for root, _, files in os.walk(directory) for f in files]
+    else:
+        paths = [os.path.join(directory, f) for f in os.listdir(directory)]
+    return sorted(p for p in paths if os.path.isfile(p) and p.lower().endswith(IMPORT_EXTENSIONS))
+
+def _wants_stream(path, min_bytes):
+    # 看不出格式的檔案交給一般流程，由它回報解析錯誤
+    try: return should_stream(path, min_bytes)
+    except Exception: return False
+
+def ingest(directory, recursive=False, jobs=None, out=sys.stdout, stream_min_bytes=STREAM_MIN_BYTES):
+    """平行解析資料夾內的檔案，成功的全部在同一個交易寫入，回傳 (新增筆數, 失敗檔案數)；
+    單一檔案解析失敗不影響其他檔案。超過 stream_min_bytes 的財政部匯出檔改成邊讀邊寫，不整個載進記憶體"""
+    def report_progress(done, total, result):
+        if result["error"]: print(f"[{done}/{total}] {result['name']}: 失敗 ({result['error']})", file=sys.stderr)
+        else: print(f"[{done}/{total}] {result['name']}: {result['format']} 格式，解析 {len(result['df'])} 筆", file=out)
+
+    paths = iter_import_files(directory, recursive)
+    streamed = [p for p in paths if _wants_stream(p, stream_min_bytes)]
+    results = parse_files([p for p in paths if p not in streamed], report_progress, jobs)
+    parsed = [r for r in results if r["error"] is None and not r["df"].empty]
+    inserted = backend.save_batches_to_db([(r["df"], r["format"]) for r in parsed])
+    for r, n in zip(parsed, inserted):
+        print(f"{r['name']}: 新增 {n} 筆，略過 {len(r['df']) - n} 筆重複", file=out)
+    failed = sum(r["error"] is not None for r in results)
+    for path in streamed:
+        try: n = backend.import_messy_excel_stream(path)
+        except Exception as e:
+            print(f"{path}: 串流匯入失敗 ({type(e).__name__}: {e})", file=sys.stderr)
+            failed += 1
+            continue
+        print(f"{path}: mof 格式，串流匯入新增 {n} 筆", file=out)
+        inserted.append(n)
+    return sum(inserted), failed
+
+def build_report(by, month=None):
+    if by == "month": return backend.monthly_totals()
+    if by == "store": return backend.store_totals(month)
+    if by == "uncategorized": return backend.uncategorized_suggestions(month)
+    return backend.category_totals(month).sort_values("金額", ascending=False)
+
+def write_report(df, fmt, output=None):
+    if fmt == "json": text = df.to_json(orient="records", force_ascii=False, indent=2) + "\n"
+    else: text = df.to_csv(index=False)
+    if output:
+        # CSV 加 BOM，Excel 直接打開中文才不會亂碼
+        with open(output, "w", encoding="utf-8-sig" if fmt == "csv" else "utf-8", newline="") as f: f.write(text)
+    else: sys.stdout.write(text)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="智慧記帳命令列工具", formatter_class=argparse.RawDescriptionHelpFormatter,
+                                     epilog=__doc__)
+    parser.add_argument("--db", default=backend.DB_NAME, help=f"資料庫檔案 (預設 {backend.DB_NAME})")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_ingest = sub.add_parser("ingest", help="匯入資料夾內的財政部/天天記帳/標準格式檔案")
+    p_ingest.add_argument("directory")
+    p_ingest.add_argument("-r", "--recursive", action="store_true", help="包含子資料夾")
+    p_ingest.add_argument("-j", "--jobs", type=int, help="同時解析的行程數 (預設 CPU 核心數)")
+    p_ingest.add_argument("--stream-mb", type=float, default=STREAM_MIN_BYTES / 2**20,
+                          help=f"財政部匯出檔超過幾 MB 改用串流分批匯入 (預設 {STREAM_MIN_BYTES // 2**20})")
+
+    sub.add_parser("classify", help="依目前規則補算/重算分類")
+
+    p_report = sub.add_parser("report", help="輸出每月、分類、商店彙總或未分類建議")
+    p_report.add_argument("--by", choices=["month", "category", "store", "uncategorized"], default="month")
+    p_report.add_argument("--month", help="只看某個月 (YYYY-MM)，--by category/store/uncategorized 使用")
+    p_report.add_argument("--format", choices=["csv", "json"], default="csv")
+    p_report.add_argument("-o", "--output", help="輸出檔案 (預設 stdout)")
+
+    p_verify = sub.add_parser("verify", help="比對月彙總表與明細重算的結果")
+    p_verify.add_argument("--repair", action="store_true", help="有差異時從明細重建彙總表")
+
+    args = parser.parse_args(argv)
+    backend.DB_NAME = args.db
+    backend.init_db()
+
+    if args.command == "ingest":
+        if not os.path.isdir(args.directory): parser.error(f"找不到資料夾：{args.directory}")
+        inserted, failed = ingest(args.directory, args.recursive, args.jobs,
+                                  stream_min_bytes=int(args.stream_mb * 2**20))
+        print(f"完成：新增 {inserted} 筆" + (f"，{failed} 個檔案失敗" if failed else ""))
+        return 1 if failed else 0
+    if args.command == "classify":
+        print(f"重新分類 {backend.sync_classifications()} 筆")
+        return 0
+    if args.command == "report":
+        write_report(build_report(args.by, args.month), args.format, args.output)
+        return 0
+    if args.command == "verify":
+        diff = backend.verify_rollup(repair=args.repair)
+        if diff.empty:
+            print("月彙總表與明細一致")
+            return 0
+        print(diff.to_string(index=False))
+        print(f"{len(diff)} 筆不一致" + ("，已重建" if args.repair else "；加上 --repair 重建"))
+        return 0 if args.repair else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""延遲載入：pandas/numpy 等大模組到第一次用到才 import，讓 CLI 與後端模組 import 起來很快"""
+import importlib
+
+class LazyModule:
+    """模組代理：第一次取屬性時才真的 import，之後把模組內容搬進自己身上，不再經過 __getattr__"""
+    def __init__(self, name):
+        self.__dict__['_lazy_name'] = name
+
+    def _load(self):
+        module = importlib.import_module(self._lazy_name)
+        self.__dict__.update(module.__dict__)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        return f"<lazy module {self._lazy_name!r}>"
+
+def lazy_module(name):
+    return LazyModule(name)
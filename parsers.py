@@ -0,0 +1,299 @@
+import codecs
+import contextlib
+import io
+import os
+import re
+import sys
+import types
+import perf
+from lazy import lazy_module
+
+pd = lazy_module("pandas")
+np = lazy_module("numpy")
+
+# ==========================================
+# 匯入檔解析 (財政部電子發票、天天記帳)
+# ==========================================
+
+MOF_DATE_PATTERN = r'(\d{4})年(\d{1,2})月(\d{1,2})日'
+MOF_NUMBER_PATTERN = r'\b(\d+)\b'
+MOF_CHUNK_ROWS = 50000
+STREAM_MIN_BYTES = 64 * 2**20   # 財政部匯出檔超過這個大小，CLI 改用串流模式分批匯入
+SNIFF_BYTES = 64 * 1024         # 串流模式只拿檔案開頭這麼多來判斷編碼
+IMPORT_EXTENSIONS = ('.csv', '.xlsx')
+
+def parse_messy_excel_rowwise(df_raw):
+    """原本逐列解析的版本，保留當作向量化版本的對照組 (benchmark 會比對輸出)"""
+    clean_data = []
+    all_rows = []
+    for index, row in df_raw.iterrows():
+        row_str = " ".join([str(x) for x in row.values if pd.notna(x)])
+        all_rows.append(row_str)
+
+    temp_date, temp_price = None, None
+    for line in all_rows:
+        date_match = re.search(MOF_DATE_PATTERN, line)
+        if date_match:
+            year, month, day = date_match.groups()
+            temp_date = f"{year}-{int(month):02d}-{int(day):02d}"
+            numbers = re.findall(r'\b\d+\b', line)
+            for num in numbers:
+                val = int(num)
+                if val != int(year) and val != int(month) and val != int(day) and val < 1000000:
+                    temp_price = val
+        elif temp_date and temp_price:
+            store_name = line.strip()
+            if store_name and "變條碼" not in store_name:
+                clean_data.append({"日期": temp_date, "商店名稱": store_name, "品項": "一般消費", "金額": temp_price})
+                temp_date, temp_price = None, None
+    return pd.DataFrame(clean_data)
+
+def _join_cells(df_raw):
+    # 等同逐列 " ".join(str(x) for x in row if notna(x))，但一次處理一整欄
+    lines = pd.Series([''] * len(df_raw), index=df_raw.index, dtype=object)
+    started = np.zeros(len(df_raw), dtype=bool)
+    for col in df_raw.columns:
+        values = df_raw[col]
+        present = values.notna().to_numpy()
+        if not present.any(): continue
+        # datetime 欄位 astype(str) 會省略時間，跟 str(Timestamp) 不同，只能逐格轉
+        if values.dtype.kind in 'mM': text = values.map(str).astype(object)
+        else: text = values.astype(str).astype(object)
+        sep = np.where(started, ' ', '')
+        lines = lines.where(~present, lines + sep + text)
+        started |= present
+    return lines
+
+def _to_int(digits):
+    # 全形數字 astype 不一定吃得下，交給 int() 處理
+    try: return digits.astype('int64')
+    except (ValueError, TypeError): return digits.map(int).astype('int64')
+
+def _parse_messy_lines(lines, state=(None, None)):
+    """向量化的狀態機：日期列帶出日期與金額，之後第一個有效的非日期列就是店名。
+    state 是上一批結束時的 (temp_date, temp_price)，回傳 (結果, 新的 state)"""
+    lines = lines.reset_index(drop=True)
+    temp_date, temp_price = state
+    ymd = lines.str.extract(MOF_DATE_PATTERN)
+    is_date = ymd[0].notna().to_numpy()
+    # 第 0 段是本批第一個日期列之前的內容，沿用上一批留下的狀態
+    seg = np.cumsum(is_date)
+    n_seg = int(seg[-1]) + 1 if len(seg) else 1
+    date_idx = np.flatnonzero(is_date)
+
+    # 每個日期列的日期字串與金額 (最後一個不是年/月/日且小於一百萬的數字)
+    y = _to_int(ymd.loc[is_date, 0]); m = _to_int(ymd.loc[is_date, 1]); d = _to_int(ymd.loc[is_date, 2])
+    dates = np.empty(n_seg, dtype=object)
+    dates[0] = temp_date
+    dates[1:] = (ymd.loc[is_date, 0] + '-' + m.map('{:02d}'.format) + '-' + d.map('{:02d}'.format)).to_numpy()
+    own = pd.Series(np.nan, index=range(n_seg))
+    own[0] = np.nan if temp_price is None else temp_price
+    if len(date_idx):
+        nums = lines[is_date].str.extractall(MOF_NUMBER_PATTERN)[0]
+        if len(nums):
+            row = nums.index.get_level_values(0)
+            small = nums.str.lstrip('0').str.len().to_numpy() <= 6
+            vals = pd.Series(-1, index=nums.index, dtype='int64')
+            vals[small] = _to_int(nums[small]).to_numpy()
+            keep = small & (vals.to_numpy() != y.reindex(row).to_numpy()) \
+                & (vals.to_numpy() != m.reindex(row).to_numpy()) & (vals.to_numpy() != d.reindex(row).to_numpy())
+            last = vals[keep].groupby(level=0).last()
+            own[seg[last.index.to_numpy()]] = last.to_numpy()
+
+    # 每一段第一個有效店名列 (非空白且不含「變條碼」)
+    stripped = lines.str.strip()
+    valid = ~is_date & (stripped != '').to_numpy() & ~stripped.str.contains('變條碼', regex=False).to_numpy()
+    first_store = pd.Series(np.flatnonzero(valid)).groupby(seg[valid]).first()
+    has_store = np.zeros(n_seg, dtype=bool)
+    has_store[first_store.index.to_numpy()] = True
+
+    # 日期列沒有金額時沿用上一段的金額；上一段已經有店名 (已輸出或金額為 0) 就歸零
+    prev_has_store = np.concatenate([[False], has_store[:-1]])
+    price = own.copy()
+    price[own.isna().to_numpy() & prev_has_store] = 0
+    price = price.ffill().fillna(0).to_numpy(copy=True)
+    if temp_date is None: price[0] = 0
+
+    emit = has_store & (price > 0)
+    segs = np.flatnonzero(emit)
+    result = pd.DataFrame({"日期": dates[segs],
+                           "商店名稱": stripped.to_numpy()[first_store.reindex(segs).to_numpy()] if len(segs) else [],
+                           "品項": "一般消費",
+                           "金額": price[segs].astype('int64')}) if len(segs) else pd.DataFrame()
+
+    last_seg = n_seg - 1
+    if emit[last_seg] or dates[last_seg] is None: new_state = (None, None)
+    else: new_state = (dates[last_seg], int(price[last_seg]) if price[last_seg] > 0 else None)
+    return result, new_state
+
+@perf.timed()
+def parse_messy_excel(df_raw):
+    """解析財政部電子發票複製貼上的 Excel/CSV，輸出與 parse_messy_excel_rowwise 相同"""
+    if df_raw.empty: return pd.DataFrame()
+    return _parse_messy_lines(_join_cells(df_raw))[0]
+
+def _head_bytes(source):
+    # 檔案開頭一小段 (檔案物件讀完會倒回原位)
+    if hasattr(source, 'read'):
+        pos = source.tell()
+        data = source.read(SNIFF_BYTES)
+        source.seek(pos)
+        return data if isinstance(data, bytes) else data.encode('utf-8')
+    with open(source, 'rb') as f: return f.read(SNIFF_BYTES)
+
+def _xlsx_rows(source):
+    from openpyxl import load_workbook
+    return load_workbook(source, read_only=True, data_only=True).active.iter_rows(values_only=True)
+
+def _read_chunks(source, chunksize):
+    # CSV 用 pandas 分批讀，編碼看檔案開頭判斷 (跟 read_table 一樣支援 Big5)；
+    # XLSX 用 openpyxl read_only 逐列讀，第一列當標題 (跟 read_excel 一樣)
+    name = getattr(source, 'name', source)
+    if str(name).lower().endswith('.xlsx'):
+        rows = _xlsx_rows(source)
+        header = next(rows, None)
+        if header is None: return
+        batch = []
+        for r in rows:
+            batch.append(r)
+            if len(batch) >= chunksize:
+                yield pd.DataFrame(batch, columns=range(len(header)))
+                batch = []
+        if batch: yield pd.DataFrame(batch, columns=range(len(header)))
+    else:
+        encoding = sniff_encoding(_head_bytes(source), final=False)
+        yield from pd.read_csv(source, chunksize=chunksize, encoding=encoding)
+
+def iter_messy_excel_batches(source, chunksize=MOF_CHUNK_ROWS):
+    """大檔案的串流模式：分批讀取、分批解析，每批 yield 一個乾淨的 DataFrame；
+    解析狀態會跨批延續，所以發票剛好被切在兩批中間也不會漏"""
+    state = (None, None)
+    for chunk in _read_chunks(source, chunksize):
+        result, state = _parse_messy_lines(_join_cells(chunk), state)
+        if not result.empty: yield result
+
+# --- 🔥 新增：天天記帳 App 專用解析器 ---
+@perf.timed()
+def parse_daily_accounting(df):
+    """處理天天記帳匯出的 CSV"""
+    # 1. 篩選只要「支出」
+    if '收支區分' in df.columns:
+        df = df[df['收支區分'] == '支'].copy()
+
+    # 2. 處理日期 (20251126 -> 2025-11-26)
+    # 先轉字串，再轉日期格式
+    df['日期'] = pd.to_datetime(df['日期'].astype(str), format='%Y%m%d').dt.strftime('%Y-%m-%d')
+
+    # 3. 處理品項 (使用備註，若無則用空白)
+    df['品項'] = df['備註'].fillna('')
+    # 如果備註是空的，就用類別名稱代替 (例如「飲食」)
+    df.loc[df['品項'] == '', '品項'] = df['類別']
+
+    # 4. 處理商店名稱 (天天記帳通常沒有店名，給預設值)
+    df['商店名稱'] = '-'
+
+    # 5. 處理分類 (直接沿用 App 的分類到 fixed_category)
+    # 這裡可以做一個簡單的對照，或者直接信賴 App 的分類
+    df['fixed_category'] = df['類別'] # 這一招很強，直接把它的分類變成我們的「強制分類」
+
+    return df[['日期', '商店名稱', '品項', '金額', 'fixed_category']]
+
+# --- 格式偵測：上傳檔與 CLI 匯入共用 ---
+CSV_ENCODINGS = ('utf-8-sig', 'big5')  # 天天記帳有時候是 Big5
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)): return bytes(source)
+    if hasattr(source, 'read'):
+        if hasattr(source, 'seek'): source.seek(0)
+        return source.read()
+    with open(source, 'rb') as f: return f.read()
+
+def sniff_encoding(data, final=True):
+    """CSV 的編碼：依序試 CSV_ENCODINGS，直接對記憶體中的內容解碼，不用重讀檔案；
+    final=False 代表 data 只是檔案開頭，結尾被切斷的半個字不算錯"""
+    for encoding in CSV_ENCODINGS:
+        try:
+            codecs.getincrementaldecoder(encoding)().decode(data, final=final)
+            return encoding
+        except UnicodeDecodeError: continue
+    raise ValueError(f"無法辨識的文字編碼 (試過 {', '.join(CSV_ENCODINGS)})")
+
+def read_table(source, name=None):
+    """讀取 CSV/XLSX (路徑、上傳的檔案物件或 bytes)；整個檔案只讀一次，編碼在記憶體裡判斷"""
+    name = str(name or getattr(source, 'name', source))
+    data = _read_bytes(source)
+    if name.lower().endswith('.csv'):
+        return pd.read_csv(io.StringIO(data.decode(sniff_encoding(data))))
+    return pd.read_excel(io.BytesIO(data))
+
+def read_header(path):
+    """只讀標題列 (判斷格式用)，不把整個檔案載進來"""
+    if str(path).lower().endswith('.xlsx'):
+        header = next(_xlsx_rows(path), None) or ()
+        return pd.DataFrame(columns=[h for h in header if h is not None])
+    return pd.read_csv(path, nrows=0, encoding=sniff_encoding(_head_bytes(path), final=False))
+
+def should_stream(path, min_bytes=STREAM_MIN_BYTES):
+    """大到要分批匯入的財政部匯出檔；其他格式都不大，照一般流程整個讀"""
+    return os.path.getsize(path) >= min_bytes and detect_format(read_header(path)) == 'mof'
+
+def detect_format(df_raw):
+    """'daily' (天天記帳)、'mof' (財政部複製貼上) 或 'standard' (已經有商店名稱欄位)"""
+    if '收支區分' in df_raw.columns and '備註' in df_raw.columns: return 'daily'
+    if '商店名稱' not in df_raw.columns and '店名' not in df_raw.columns: return 'mof'
+    return 'standard'
+
+def parse_import(df_raw, fmt=None):
+    """依格式轉成 日期/商店名稱/品項/金額 (天天記帳另有 fixed_category)，回傳 (DataFrame, 格式)"""
+    fmt = fmt or detect_format(df_raw)
+    if fmt == 'daily': return parse_daily_accounting(df_raw), fmt
+    if fmt == 'mof': return parse_messy_excel(df_raw), fmt
+    df_clean = df_raw.rename(columns={'消費日期':'日期', '店名':'商店名稱', '總金額':'金額'})
+    if '品項' not in df_clean: df_clean['品項'] = '一般消費'
+    return df_clean, fmt
+
+def parse_file(source, name=None):
+    """讀檔 + 判斷格式 + 解析，給行程池用 (只回傳可以 pickle 的結果)"""
+    name = str(name or getattr(source, 'name', source))
+    try:
+        df_clean, fmt = parse_import(read_table(source, name))
+        return {"name": name, "format": fmt, "df": df_clean, "error": None}
+    except Exception as e:
+        return {"name": name, "format": None, "df": None, "error": f"{type(e).__name__}: {e}"}
+
+@contextlib.contextmanager
+def _bare_main():
+    # spawn 的子行程會先重新執行 __main__ 指向的檔案；在 Streamlit 裡那是 app.py，
+    # 每個 worker 都會把整個儀表板 (init_db、查詢、st.*) 再跑一次。啟動 worker 時暫時換成空的 __main__
+    main = sys.modules.get('__main__')
+    sys.modules['__main__'] = types.ModuleType('__main__')
+    try: yield
+    finally: sys.modules['__main__'] = main
+
+def parse_files(sources, progress=None, max_workers=None):
+    """多個檔案平行解析 (sources 是路徑或 (檔名, bytes))，回傳順序與輸入相同；
+    progress(完成數, 總數, 結果) 在呼叫端的執行緒裡逐檔回報"""
+    jobs = [(s[1], s[0]) if isinstance(s, tuple) else (s, None) for s in sources]
+    results = [None] * len(jobs)
+    if len(jobs) <= 1:
+        # 只有一個檔案就不開行程池，省下啟動子行程的時間
+        for i, job in enumerate(jobs):
+            results[i] = parse_file(*job)
+            if progress: progress(i + 1, len(jobs), results[i])
+        return results
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+    workers = min(len(jobs), max_workers or os.cpu_count() or 1)
+    # spawn：主行程有寫入執行緒，fork 可能連同鎖一起複製過去
+    with ProcessPoolExecutor(workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        # worker 在 submit 時才啟動，只有這段需要換掉 __main__
+        with _bare_main():
+            futures = {pool.submit(parse_file, *job): i for i, job in enumerate(jobs)}
+        for done, future in enumerate(as_completed(futures), 1):
+            i = futures[future]
+            try: results[i] = future.result()
+            except Exception as e:  # 子行程掛掉之類的情況
+                results[i] = {"name": jobs[i][1] or str(jobs[i][0]), "format": None, "df": None,
+                              "error": f"{type(e).__name__}: {e}"}
+            if progress: progress(done, len(jobs), results[i])
+    return results
@@ -0,0 +1,148 @@
+"""效能記錄：量每個階段的耗時、處理筆數與記憶體變化，寫成 JSON lines。
+
+預設關閉。環境變數 ACCOUNTING_PERF=1 (或 set_enabled) 是整個行程的預設值，連記憶體一起量；
+begin_run(enabled=...) 只開/關目前這個執行緒 (Streamlit 的一個 session 這次 rerun)，不影響其他使用者，
+這種情況不量記憶體 (tracemalloc 是整個行程共用的，會拖慢所有人)。
+關閉時 span() 回傳共用的空物件、timed() 只多一次旗標檢查，幾乎沒有額外成本。
+"""
+import functools
+import json
+import os
+import threading
+import time
+import tracemalloc
+import uuid
+
+PERF_ENV = "ACCOUNTING_PERF"
+PERF_LOG_ENV = "ACCOUNTING_PERF_LOG"
+PERF_LOG_FILE = os.environ.get(PERF_LOG_ENV, "perf.jsonl")
+
+_enabled = os.environ.get(PERF_ENV, "").lower() in ("1", "true", "yes", "on")
+class _ThreadState(threading.local):
+    # 類別屬性當預設值：沒設定過的執行緒讀得到，不用走 getattr 的例外路徑 (關閉時的熱路徑)
+    enabled = None  # None 代表沿用行程預設值
+    depth = 0
+    run = None
+
+_local = _ThreadState()
+_log_lock = threading.Lock()
+
+def is_enabled():
+    """目前執行緒是否在記錄 (begin_run 有指定就照它，否則用行程預設值)"""
+    return _enabled if _local.enabled is None else _local.enabled
+
+def set_enabled(on):
+    """開/關整個行程的預設值；記憶體變化用 tracemalloc 量，只在開啟時追蹤"""
+    global _enabled
+    _enabled = bool(on)
+    if _enabled and not tracemalloc.is_tracing(): tracemalloc.start()
+    elif not _enabled and tracemalloc.is_tracing(): tracemalloc.stop()
+
+if _enabled: set_enabled(True)
+
+class _NullSpan:
+    # 關閉時共用的空 span：可以 with、可以設 rows，什麼都不做
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+    def __setattr__(self, name, value): pass
+
+_NULL_SPAN = _NullSpan()
+
+def _memory_mb():
+    return tracemalloc.get_traced_memory()[0] / 2**20 if tracemalloc.is_tracing() else None
+
+class _Span:
+    __slots__ = ("name", "rows", "start", "mem", "depth")
+
+    def __init__(self, name, rows):
+        self.name, self.rows = name, rows
+
+    def __enter__(self):
+        self.depth = _local.depth
+        _local.depth = self.depth + 1
+        self.mem = _memory_mb()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.start
+        _local.depth = self.depth
+        mem = _memory_mb()
+        _record({
+            "name": self.name, "seconds": round(seconds, 6), "rows": self.rows, "depth": self.depth,
+            "mem_delta_mb": round(mem - self.mem, 3) if mem is not None and self.mem is not None else None,
+            "error": exc_type.__name__ if exc_type else None, "start": self.start,
+        })
+        return False
+
+def span(name, rows=None):
+    """with perf.span("階段名稱") as s: ...; s.rows = 筆數"""
+    on = _local.enabled
+    return _Span(name, rows) if (_enabled if on is None else on) else _NULL_SPAN
+
+def _default_rows(result):
+    # DataFrame / (DataFrame, 總筆數) 這類回傳值自動帶出筆數
+    if isinstance(result, tuple) and result: result = result[0]
+    shape = getattr(result, 'shape', None)
+    return shape[0] if shape else None
+
+def timed(name=None, rows=_default_rows):
+    """裝飾器版本的 span；rows(回傳值) 算出處理筆數"""
+    def decorate(fn):
+        label = name or fn.__name__
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            on = _local.enabled
+            if not (_enabled if on is None else on): return fn(*args, **kwargs)
+            with _Span(label, None) as s:
+                result = fn(*args, **kwargs)
+                s.rows = rows(result) if rows else None
+            return result
+        return wrapper
+    return decorate
+
+# --- 以「一次執行」為單位收集 (Streamlit 每次 rerun 一次) ---
+def _record(entry):
+    entry["ts"] = round(time.time(), 3)
+    start = entry.pop("start")
+    run = _local.run
+    if run is not None:
+        entry["run"] = run["id"]
+        entry["offset"] = round(start - run["t0"], 6)
+        run["records"].append(entry)
+    else:
+        _write_log([entry])
+
+def _write_log(entries):
+    if not entries: return
+    lines = "".join(json.dumps(e, ensure_ascii=False) + "\n" for e in entries)
+    try:
+        with _log_lock, open(PERF_LOG_FILE, "a", encoding="utf-8") as f: f.write(lines)
+    except OSError: pass  # 記錄失敗不影響主程式
+
+def begin_run(label="", enabled=None):
+    """開始新的一次執行；enabled 只決定這個執行緒要不要記錄 (None 用行程預設值)。
+    上一次沒走到 end_run (例如 st.rerun 中斷) 的紀錄先寫進 log"""
+    pending = _local.run
+    if pending is not None: _write_log(pending["records"])
+    _local.enabled = _enabled if enabled is None else bool(enabled)
+    _local.depth = 1  # 第 0 層留給整次執行的總計
+    _local.run = ({"id": uuid.uuid4().hex[:12], "label": label, "records": [], "t0": time.perf_counter()}
+                  if _local.enabled else None)
+
+def in_run():
+    """目前執行緒是否在 begin_run 與 end_run 之間 (整頁 rerun 裡的 fragment 不用另外開一次執行)"""
+    return _local.enabled is not None
+
+def end_run():
+    """結束這次執行、寫入 log，回傳這次的紀錄 (依開始時間排序，外層階段在內層之前)"""
+    run = _local.run
+    _local.run = None
+    _local.enabled = None
+    if run is None: return []
+    run["records"].append({"name": run["label"] or "run", "seconds": round(time.perf_counter() - run["t0"], 6),
+                           "rows": None, "depth": 0, "mem_delta_mb": None, "error": None,
+                           "ts": round(time.time(), 3), "run": run["id"], "offset": 0.0})
+    _write_log(run["records"])
+    return sorted(run["records"], key=lambda e: (e["offset"], e["depth"]))
@@ -0,0 +1,81 @@
+"""產生效能量測用的假資料：一般帳務、財政部發票匯出、天天記帳 CSV、規則組"""
+import random
+
+import numpy as np
+import pandas as pd
+
+# 連鎖店 (會被內建關鍵字或規則分到類) + 分店名
+CHAINS = [
+    "全家便利商店", "統一超商 7-ELEVEN", "萊爾富", "OK超商", "全聯福利中心", "家樂福", "好市多 Costco",
+    "星巴克", "路易莎咖啡", "麥當勞", "摩斯漢堡", "壽司郎", "鼎泰豐", "八方雲集", "台灣中油", "台塑石油",
+    "屈臣氏", "康是美", "Uniqlo", "NET", "燦坤3C", "全國電子", "誠品書店", "威秀影城", "台灣高鐵", "台鐵",
+    "Uber", "中華電信", "台灣電力公司", "台灣自來水公司",
+]
+BRANCHES = [
+    "信義店", "板橋門市", "中和店", "台北車站店", "民生店", "西門店", "新莊店", "三重店", "桃園店", "新竹店",
+    "台中公益店", "台南中華店", "高雄巨蛋店", "內湖店", "士林店", "永和店", "竹北店", "淡水店",
+]
+LOCAL_SHOPS = ["巷口小吃攤", "阿婆麵店", "早餐店", "水果行", "自助餐", "五金行", "洗衣店", "診所", "髮廊", "停車場"]
+ITEMS = ["一般消費", "一般消費", "一般消費", "-", "咖啡", "便當", "早餐", "牙膏", "衛生紙", "加油", "電影票",
+         "高鐵票", "剪髮", "感冒藥", "T恤", "耳機", "書", "水電費", "電話費", "停車費"]
+DAILY_CATEGORIES = ["飲食", "日常用品", "交通", "娛樂", "醫療保健", "居家", "服飾"]
+
+def store_names(n, seed=0):
+    """n 個店名：多數是「連鎖店 + 分店」，少數是沒有規則可分類的小店"""
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        if rng.random() < 0.8: out.append(f"{rng.choice(CHAINS)} {rng.choice(BRANCHES)}")
+        else: out.append(f"{rng.choice(LOCAL_SHOPS)}{rng.randint(1, 300)}號")
+    return out
+
+def _dates(rng, n, start="2022-01-01", days=4 * 365):
+    base = np.datetime64(start)
+    return (base + rng.integers(0, days, size=n).astype('timedelta64[D]')).astype(str)
+
+def make_expenses(n, seed=0):
+    """save_to_db 吃的格式 (日期/商店名稱/品項/金額)"""
+    rng = np.random.default_rng(seed)
+    stores = np.array(store_names(2000, seed))
+    return pd.DataFrame({
+        "日期": _dates(rng, n),
+        "商店名稱": stores[rng.integers(0, len(stores), size=n)],
+        "品項": np.array(ITEMS)[rng.integers(0, len(ITEMS), size=n)],
+        "金額": np.clip(rng.lognormal(5, 1, size=n), 1, 200000).astype('int64'),
+    })
+
+def make_mof_export(n_invoices, seed=0):
+    """財政部電子發票複製貼上格式：日期列 (含發票號碼與金額) + 店名列，偶爾夾雜手機條碼列"""
+    rng = random.Random(seed)
+    stores = store_names(2000, seed)
+    rows = []
+    for _ in range(n_invoices):
+        y, m, d = rng.choice([2023, 2024, 2025]), rng.randint(1, 12), rng.randint(1, 28)
+        rows.append([f"{y}年{m}月{d}日 AB{rng.randint(10**7, 10**8 - 1)} {rng.randint(10, 5000)}", "載具"])
+        if rng.random() < 0.1: rows.append(["手機條碼變條碼", None])
+        rows.append([rng.choice(stores), None])
+    return pd.DataFrame(rows, columns=["發票資訊", "備註"])
+
+def make_daily_accounting(n, seed=0):
+    """天天記帳匯出的 CSV 內容 (日期為 20251126 這種整數，收支區分 支/收)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.to_datetime(_dates(rng, n)).strftime('%Y%m%d').astype(int)
+    notes = np.array(ITEMS + [""] * 5, dtype=object)
+    return pd.DataFrame({
+        "日期": dates,
+        "收支區分": np.where(rng.random(n) < 0.9, "支", "收"),
+        "類別": np.array(DAILY_CATEGORIES)[rng.integers(0, len(DAILY_CATEGORIES), size=n)],
+        "備註": pd.Series(notes[rng.integers(0, len(notes), size=n)]).replace("", np.nan),
+        "金額": rng.integers(10, 3000, size=n),
+    })
+
+def make_rules(n, seed=0):
+    """n 條規則：先放連鎖店名，不夠再補隨機的店名/品項關鍵字"""
+    rng = random.Random(seed)
+    categories = ["飲食", "日常用品", "交通", "娛樂", "服飾", "醫療保健", "3C家電", "居家"]
+    keywords = iter([c.split()[0] for c in CHAINS] + ITEMS[4:] + LOCAL_SHOPS)
+    rules = {}
+    while len(rules) < n:
+        k = next(keywords, None) or f"{rng.choice(LOCAL_SHOPS)}{rng.randint(1, 10**6)}"
+        rules[k] = {"category": rng.choice(categories), "item": rng.choice([None, None, k])}
+    return rules
@@ -0,0 +1,16 @@
+import os
+import sys
+
+import pytest
+
+# 專案沒有打包，測試直接 import 根目錄的模組
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backend  # noqa: E402  (要在 sys.path 設好之後才 import)
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """每個測試一個空的暫存資料庫，回傳 backend 模組"""
+    monkeypatch.setattr(backend, "DB_NAME", str(tmp_path / "test.db"))
+    backend.init_db()
+    return backend
@@ -0,0 +1,70 @@
+"""資料庫寫入路徑：每個測試用自己的暫存資料庫"""
+import gc
+import sqlite3
+import threading
+
+import pandas as pd
+import pytest
+
+import backend
+
+def expense(store, item="一般消費", price=100, date="2025-01-05"):
+    return pd.DataFrame([{"日期": date, "商店名稱": store, "品項": item, "金額": price}])
+
+def categories(db):
+    return dict(db.load_from_db()[['商店名稱', '分類結果']].astype(str).itertuples(index=False))
+
+def test_insert_classified_before_rule_change_is_reclassified(db):
+    # 模擬排隊期間規則被改：分類用舊規則算好，寫入前另一個操作先存了新規則
+    data = db._classified_rows(db._import_rows(expense("阿婆麵店")), db.load_custom_rules())
+    db.upsert_rules([("阿婆", "飲食", None)])
+    db.run_write(db._insert_expenses, data)
+    assert categories(db) == {"阿婆麵店": "飲食"}
+    assert db.sync_classifications() == 0
+
+def test_update_uses_rules_inside_transaction(db):
+    db.save_to_db(expense("阿婆麵店"))
+    row_id = int(db.load_from_db()['id'][0])
+    db.upsert_rules([("阿婆", "飲食", None)])
+    db.bulk_apply_changes(updates=pd.DataFrame([{"id": row_id, "item": "麵", "price": 120, "fixed_category": None}]))
+    assert categories(db) == {"阿婆麵店": "飲食"}
+
+def test_stale_sync_does_not_roll_back_rules(db):
+    db.save_to_db(expense("阿婆麵店"))
+    db.upsert_rules([("阿婆", "飲食", None)])
+    # 已經排進佇列的同步不管何時執行，都以交易內的規則為準
+    db.run_write(db._sync_classifications)
+    assert categories(db) == {"阿婆麵店": "飲食"}
+    assert db.sync_classifications() == 0
+
+def test_init_db_runs_once_per_process(db, monkeypatch):
+    # 已經初始化過的資料庫不再進寫入佇列 (不會排在別人的寫入後面)
+    monkeypatch.setattr(db, "run_write", lambda *a: pytest.fail("init_db 不該再排進寫入佇列"))
+    db.init_db()
+
+def test_reader_connection_reused_across_threads(db):
+    # 每次 rerun 換一條執行緒，連線從共用池拿回來，不會每次重新連線
+    seen = []
+    for _ in range(3):
+        t = threading.Thread(target=lambda: seen.append(id(db.get_connection())))
+        t.start(); t.join()
+        gc.collect()
+    assert len(set(seen)) == 1
+
+def test_first_sync_skips_rows_classified_at_insert(db):
+    db.save_to_db(pd.DataFrame({"日期": "2025-01-05", "商店名稱": ["阿婆麵店"] * 50, "品項": "麵", "金額": 80}))
+    assert db.sync_classifications() == 0
+
+def test_upgrade_normalizes_raw_dates(tmp_path, monkeypatch):
+    # 舊版直接 to_sql 的資料庫：日期是匯入檔原本的字串
+    path = str(tmp_path / "old.db")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE expenses (id INTEGER PRIMARY KEY AUTOINCREMENT, date TEXT, store TEXT, item TEXT, price INTEGER)")
+        conn.executemany("INSERT INTO expenses (date, store, item, price) VALUES (?, ?, ?, ?)",
+                         [("2025/1/5", "全家", "咖啡", 50), ("2025-01-20 00:00:00", "全家", "咖啡", 60),
+                          ("2025-02-03", "全聯", "牙膏", 70)])
+    monkeypatch.setattr(backend, "DB_NAME", path)
+    backend.init_db()
+    assert backend.list_months() == ["2025-02", "2025-01"]
+    assert backend.search_transactions("全家", "2025-01-01", "2025-01-31")[1] == 2
+    assert backend.verify_rollup().empty
@@ -0,0 +1,38 @@
+"""重複匯入：靠內容指紋略過已經匯入過的列"""
+import pandas as pd
+
+import synthetic
+from parsers import parse_messy_excel, read_table
+
+def fingerprints(db):
+    return {r[0] for r in db.get_connection().execute("SELECT fingerprint FROM expenses")}
+
+def test_reimport_inserts_once(db):
+    df = synthetic.make_expenses(300, seed=2)
+    assert db.save_to_db(df.copy(), 'standard') == 300
+    assert db.save_to_db(df.copy(), 'standard') == 0
+    assert db.month_summary()[1] == 300
+
+def test_preview_reports_duplicates_after_import(db):
+    df = synthetic.make_expenses(120, seed=4)
+    assert db.preview_import(df, 'standard') == (120, 0)
+    db.save_to_db(df.copy(), 'standard')
+    assert db.preview_import(df, 'standard') == (0, 120)
+
+def test_identical_rows_in_one_file_are_kept(db):
+    # 同一天同一家店買兩次一樣的東西：兩筆都要留
+    df = pd.DataFrame([{"日期": "2025-01-05", "商店名稱": "全家", "品項": "咖啡", "金額": 55}] * 2)
+    assert db.save_to_db(df.copy(), 'standard') == 2
+    assert db.save_to_db(df.copy(), 'standard') == 0
+
+def test_streamed_and_whole_file_mof_share_fingerprints(db, tmp_path, monkeypatch):
+    path = str(tmp_path / "mof.csv")
+    synthetic.make_mof_export(400, seed=5).to_csv(path, index=False)
+    whole = db.save_to_db(parse_messy_excel(read_table(path)), 'mof')
+    expected = fingerprints(db)
+
+    monkeypatch.setattr(db, "DB_NAME", str(tmp_path / "streamed.db"))
+    db.init_db()
+    # chunksize 故意很小，同一批內與跨批的重複列編號都要跟整檔一致
+    assert db.import_messy_excel_stream(path, chunksize=53) == whole
+    assert fingerprints(db) == expected
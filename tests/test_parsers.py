@@ -0,0 +1,42 @@
+"""匯入檔解析：串流模式要跟整檔解析一樣、平行解析不能重跑主程式"""
+import sys
+import types
+
+import pandas as pd
+
+import synthetic
+from parsers import iter_messy_excel_batches, parse_files, parse_messy_excel, read_table, should_stream
+
+def test_stream_big5_csv_matches_read_table(tmp_path):
+    path = tmp_path / "mof.csv"
+    synthetic.make_mof_export(500, seed=1).to_csv(path, index=False, encoding="big5", errors="replace")
+    whole = parse_messy_excel(read_table(str(path)))
+    # chunksize 故意很小，發票會被切在兩批中間
+    streamed = pd.concat(iter_messy_excel_batches(str(path), chunksize=37), ignore_index=True)
+    pd.testing.assert_frame_equal(streamed, whole)
+
+def test_should_stream_only_large_mof(tmp_path):
+    mof, std = tmp_path / "mof.csv", tmp_path / "std.csv"
+    synthetic.make_mof_export(200).to_csv(mof, index=False, encoding="big5", errors="replace")
+    synthetic.make_expenses(200).to_csv(std, index=False)
+    assert should_stream(str(mof), min_bytes=1)
+    assert not should_stream(str(std), min_bytes=1)
+    assert not should_stream(str(mof))
+
+def test_parse_files_workers_do_not_rerun_main_script(tmp_path, monkeypatch):
+    # 模擬 Streamlit：__main__ 換成一個 __file__ 指向 app 腳本的模組
+    marker = tmp_path / "ran.txt"
+    script = tmp_path / "fake_app.py"
+    script.write_text(f"open({str(marker)!r}, 'a').write('ran\\n')\n", encoding="utf-8")
+    fake_main = types.ModuleType("__main__")
+    fake_main.__file__ = str(script)
+    monkeypatch.setitem(sys.modules, "__main__", fake_main)
+
+    paths = []
+    for i in range(2):
+        paths.append(str(tmp_path / f"std{i}.csv"))
+        synthetic.make_expenses(20, seed=i).to_csv(paths[-1], index=False)
+    results = parse_files(paths, max_workers=2)
+    assert [r["error"] for r in results] == [None, None]
+    assert not marker.exists()
+    assert sys.modules["__main__"] is fake_main
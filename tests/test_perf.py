@@ -0,0 +1,31 @@
+"""效能記錄的開關只影響開啟它的執行緒"""
+import threading
+
+import perf
+
+def test_begin_run_enables_only_current_thread(tmp_path, monkeypatch):
+    monkeypatch.setattr(perf, "PERF_LOG_FILE", str(tmp_path / "perf.jsonl"))
+    other = {}
+    def other_session():
+        perf.begin_run("other")
+        other["enabled"] = perf.is_enabled()
+        with perf.span("別人的階段"): pass
+        other["records"] = perf.end_run()
+
+    perf.begin_run("mine", enabled=True)
+    t = threading.Thread(target=other_session)
+    t.start(); t.join()
+    with perf.span("我的階段"): pass
+    records = perf.end_run()
+    assert other == {"enabled": False, "records": []}
+    assert [r["name"] for r in records] == ["mine", "我的階段"]
+    assert records[1]["mem_delta_mb"] is None  # 只開在 session 上不啟動 tracemalloc
+    assert not perf.is_enabled()
+
+def test_in_run_marks_begin_to_end(tmp_path, monkeypatch):
+    monkeypatch.setattr(perf, "PERF_LOG_FILE", str(tmp_path / "perf.jsonl"))
+    assert not perf.in_run()
+    perf.begin_run("full")  # 預設關閉也算在執行中
+    assert perf.in_run()
+    perf.end_run()
+    assert not perf.in_run()
@@ -0,0 +1,37 @@
+"""月彙總表由 trigger 維護：每種寫入之後都要跟從明細重算的結果一致"""
+import pandas as pd
+
+import synthetic
+
+def assert_consistent(db):
+    diff = db.verify_rollup()
+    assert diff.empty, diff.to_string()
+
+def test_rollup_tracks_every_write_path(db):
+    db.save_to_db(synthetic.make_expenses(2000, seed=3), 'standard')
+    assert_consistent(db)
+
+    ledger = db.load_from_db()
+    ids = ledger['id'].head(40).tolist()
+    updates = pd.DataFrame({"id": ids[:20], "item": "改過的品項", "price": 999, "fixed_category": "娛樂"})
+    db.bulk_apply_changes(deletes=ids[20:], updates=updates)
+    assert_consistent(db)
+
+    target = int(ledger['id'].iloc[100])
+    split = pd.DataFrame([{"date": "2025-03-01", "store": "全家", "item": "咖啡", "price": 40, "fixed_category": "飲食"},
+                          {"date": "2025-03-01", "store": "全家", "item": "牙膏", "price": 60, "fixed_category": "日常用品"}])
+    assert db.split_transaction(target, split)
+    assert_consistent(db)
+
+    # 規則變動：重新分類的列要從「其他」搬到新分類 (含未分類的商店/品項維度)
+    before = db.month_summary()[2]
+    db.upsert_rules([("早餐店", "飲食", None), ("診所", "醫療保健", None)])
+    assert db.month_summary()[2] < before
+    assert_consistent(db)
+    db.save_all_rules({})
+    assert_consistent(db)
+
+    db.clear_db()
+    assert_consistent(db)
+    assert db.month_summary() == (0, 0, 0)
+    assert db.uncategorized_suggestions().empty
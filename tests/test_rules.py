@@ -0,0 +1,58 @@
+"""apply_rules_to_df 必須跟逐列的 apply_rules_to_row 每一列都一樣"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from backend import apply_rules_to_df, apply_rules_to_row, compile_rules
+
+def rowwise(df, rules):
+    out = df.apply(lambda r: apply_rules_to_row(r, rules), axis=1)
+    out.columns = ['分類結果', '顯示品項']
+    return out
+
+def assert_parity(df, rules):
+    expected = rowwise(df, rules)
+    actual = apply_rules_to_df(df, compile_rules(rules))
+    assert actual['分類結果'].tolist() == expected['分類結果'].tolist()
+    assert actual['顯示品項'].tolist() == expected['顯示品項'].tolist()
+
+def frame(rows):
+    return pd.DataFrame(rows, columns=['商店名稱', '品項', 'fixed_category'])
+
+def test_fixed_category_set_empty_nan():
+    rules = {"咖啡": {"category": "飲食", "item": None}}
+    df = frame([["星巴克", "咖啡", "娛樂"], ["星巴克", "咖啡", ""], ["星巴克", "咖啡", np.nan],
+                ["星巴克", "咖啡", None], ["路邊攤", "咖啡", "交通"]])
+    assert_parity(df, rules)
+    assert apply_rules_to_df(df, compile_rules(rules))['分類結果'].tolist() == ["娛樂", "飲食", "飲食", "飲食", "交通"]
+
+def test_nan_items_and_stores():
+    rules = {"nan": {"category": "其他", "item": "補上品項"}, "阿婆": {"category": "飲食", "item": "麵"}}
+    df = frame([["阿婆麵店", np.nan, None], [np.nan, "牙膏", None], ["全家", None, None], [np.nan, np.nan, None]])
+    assert_parity(df, rules)
+
+def test_empty_keyword_matches_everything():
+    rules = {"": {"category": "娛樂", "item": None}, "咖啡": {"category": "飲食", "item": None}}
+    df = frame([["星巴克", "咖啡", None], ["全家", "-", None], ["", "", None]])
+    assert_parity(df, rules)
+    assert set(apply_rules_to_df(df, compile_rules(rules))['分類結果']) == {"娛樂"}
+
+def test_first_matching_rule_wins():
+    # 「全家」在商店、「咖啡」在品項都命中，取規則順序在前面的；內建關鍵字排在所有自訂規則之後
+    df = frame([["全家 信義店", "咖啡", None], ["全聯", "咖啡", None], ["全家 信義店", "便當", None]])
+    assert_parity(df, {"咖啡": {"category": "娛樂", "item": None}, "全家": {"category": "居家", "item": None}})
+    assert_parity(df, {"全家": {"category": "居家", "item": None}, "咖啡": {"category": "娛樂", "item": None}})
+    # 較長、較短的關鍵字互相包含時也一樣看順序
+    assert_parity(df, {"全": {"category": "交通", "item": None}, "全家 信義": {"category": "居家", "item": None}})
+
+@pytest.mark.parametrize("item", ["一般消費", "-", "nan", "", np.nan, "咖啡"])
+def test_default_item_substitution(item):
+    rules = {"星巴克": {"category": "飲食", "item": "拿鐵"}, "全家": {"category": "飲食", "item": None}}
+    df = frame([["星巴克 信義店", item, None], ["全家", item, None], ["星巴克", item, "交通"]])
+    assert_parity(df, rules)
+
+def test_synthetic_parity():
+    df = synthetic.make_expenses(3000, seed=7)
+    df['fixed_category'] = np.where(np.arange(len(df)) % 17 == 0, "交通", None)
+    assert_parity(df, synthetic.make_rules(50))
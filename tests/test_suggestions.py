@@ -0,0 +1,38 @@
+"""未分類建議：店名分群與彙總"""
+import pandas as pd
+
+from backend import store_keywords
+
+def keywords(*names):
+    return dict(zip(names, store_keywords(list(names))))
+
+def test_chain_branches_merge():
+    assert set(keywords("路易莎咖啡 信義店", "路易莎咖啡 板橋門市").values()) == {"路易莎咖啡"}
+    assert set(keywords("星巴克信義店", "星巴克板橋門市", "星巴克").values()) == {"星巴克"}
+    assert set(keywords("阿婆麵店12號", "阿婆麵店135號").values()) == {"阿婆麵店"}
+
+def test_legal_suffix_and_branch_company_merge():
+    names = ("統一超商股份有限公司台北市第一分公司", "統一超商股份有限公司台北市第二分公司",
+             "統一超商股份有限公司新北市第三分公司")
+    assert set(keywords(*names).values()) == {"統一超商"}
+
+def test_different_companies_with_shared_prefix_stay_apart():
+    kw = keywords("台灣大哥大股份有限公司", "台灣大車隊股份有限公司")
+    assert kw == {"台灣大哥大股份有限公司": "台灣大哥大", "台灣大車隊股份有限公司": "台灣大車隊"}
+    kw = keywords("台灣高鐵", "台灣中油")
+    assert kw == {"台灣高鐵": "台灣高鐵", "台灣中油": "台灣中油"}
+
+def test_keyword_is_substring_of_every_name():
+    names = ["統一超商 7-ELEVEN 士林店", "全家便利商店股份有限公司 信義店", "早餐店3號", "85度C信義店",
+             "85度C板橋店", "台灣電力公司", "XX分公司", "A"]
+    for name, key in zip(names, store_keywords(names)):
+        assert key and key in name
+
+def test_suggestion_totals_cover_whole_group(db):
+    stores = ["統一超商股份有限公司台北市第一分公司", "統一超商股份有限公司台北市第二分公司",
+              "統一超商股份有限公司新北市第三分公司", "台灣大哥大股份有限公司", "台灣大車隊股份有限公司"]
+    db.save_to_db(pd.DataFrame({"日期": "2025-01-05", "商店名稱": stores, "品項": "一般消費", "金額": [100, 200, 300, 50, 40]}))
+    out = db.uncategorized_suggestions().set_index('關鍵字')
+    assert out.loc["統一超商", ['參考金額', '筆數', '店名數']].tolist() == [600, 3, 3]
+    assert {"台灣大哥大", "台灣大車隊"} <= set(out.index)
+    assert out.index[0] == "統一超商"  # 影響金額大的排前面